@@ -0,0 +1,103 @@
+"""
+asyncio engine for running RIP version 2 routers.
+    Each input socket is watched with loop.add_reader, and the periodic,
+    triggered and route expiry timers are scheduled with loop.call_at, so any
+    number of routers can share a single event loop. Readable sockets are
+    drained, and the packets read in one pass of the loop are applied to a
+    router's table together. The event loop's waits cannot be timed, so
+    routers run here report no select_seconds histogram.
+"""
+
+import asyncio
+
+
+class AsyncEngine:
+    """
+    Runs a single Router on an asyncio event loop.
+     - Start with AsyncEngine.start()
+     - Stop with AsyncEngine.close()
+    """
+    def __init__(self, router, loop):
+        self.router = router
+        self.loop = loop
+        self.timer = None
+        self.wake_time = None
+        self.batch = [] # (data, port) datagrams waiting to be applied together
+        router.metrics.select_seconds = None
+
+
+    async def start(self):
+        """ Open the router's sockets and watch each input socket"""
+        self.router.open()
+        for sock in self.router.sockets:
+            self.loop.add_reader(sock, self.socket_readable, sock)
+        if self.router.metrics_socket is not None:
+            self.loop.add_reader(self.router.metrics_socket, self.router.answer_metrics_query)
+        self.on_timer()
+
+
+    def close(self):
+        """ Cancel timers and close the router's sockets"""
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.router.metrics_socket is not None:
+            self.loop.remove_reader(self.router.metrics_socket)
+        for sock in self.router.sockets:
+            self.loop.remove_reader(sock)
+        self.router.close()
+
+
+    def schedule(self, delay):
+        """ (Re)schedule the router's timers to run after delay seconds"""
+        if self.timer is not None:
+            self.timer.cancel()
+        self.wake_time = self.loop.time() + delay
+        self.timer = self.loop.call_at(self.wake_time, self.on_timer)
+
+
+    def on_timer(self):
+        """ Send due updates, expire routes and wait for the next deadline"""
+        self.schedule(self.router.process_timers())
+
+
+    def socket_readable(self, sock):
+        """ Read the packets waiting on an input socket, to be processed with
+            any others read in the same pass of the event loop"""
+        if not self.batch:
+            self.loop.call_soon(self.process_batch)
+        self.router.receive_batch(sock, self.batch)
+
+
+    def process_batch(self):
+        """ Process the queued packets, waking earlier if they made an update or
+            expiry due sooner than the current timer"""
+        batch, self.batch = self.batch, []
+        if batch:
+            self.router.handle_packets(batch)
+        event_time = self.router.get_event_time()
+        if event_time is not None and self.loop.time() + event_time < self.wake_time:
+            self.schedule(event_time)
+
+
+async def serve(routers):
+    """ Run several routers on the running event loop until cancelled"""
+    loop = asyncio.get_running_loop()
+    engines = [AsyncEngine(router, loop) for router in routers]
+    try:
+        for engine in engines:
+            await engine.start()
+        await loop.create_future() # run until cancelled
+    finally:
+        for engine in engines:
+            engine.close()
+
+
+def run_async(routers, use_uvloop=False):
+    """ Run routers on a new asyncio (or uvloop) event loop"""
+    if use_uvloop:
+        try:
+            import uvloop
+        except ImportError:
+            raise Exception("uvloop is not installed")
+        uvloop.install()
+    asyncio.run(serve(routers))
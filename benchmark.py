@@ -0,0 +1,417 @@
+"""
+Headless benchmarks for the RIP version 2 implementation.
+    Results are printed (or saved) as JSON so that runs can be compared.
+    Usage: python3 benchmark.py [benchmark-name ...] [--output <filename>]
+                                [--sizes <n,n,...>] [--seed <seed>]
+"""
+
+import argparse
+import json
+import random
+import socket
+import statistics
+import sys
+import tracemalloc
+from collections import Counter
+from time import perf_counter
+import config_builder
+from forwarding_table import ForwardingTable
+from packets import *
+from rip_router import Router, LOCALHOST
+from simulator import Simulator, configs_from_adjacency
+
+DEFAULT_TIMERS = ((30, 5), 180, 300, (1, 5))
+FIRST_PORT = 40000
+ROUNDS = 200
+NETWORK_SIZES = [10, 100, 1000]
+TABLE_SIZES = [10000, 100000]
+AVERAGE_DEGREE = 4
+CONVERGENCE_LIMIT = 3600 # virtual seconds to wait for a network to converge
+SEED = 364
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """ Register a function as a named benchmark"""
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def make_router(num_neighbours, num_routes, router_id=1):
+    """ Create a Router with a given number of neighbours and learned routes.
+        Neighbours are given ports that nothing listens on."""
+    outputs = [
+        RoutingEntry(router_id + i + 1, FIRST_PORT + i, 1, None, None)
+        for i in range(num_neighbours)
+    ]
+    router = Router(router_id, [FIRST_PORT - 1], outputs, DEFAULT_TIMERS)
+    for destination in range(num_routes):
+        next_hop = outputs[destination % num_neighbours].router_id
+        router.forwarding_table[1000 + destination] = RoutingEntry(
+            next_hop, None, 2, 0.0, None
+        )
+    router.invalidate_adverts()
+    return router
+
+
+class CountingSocket(socket.socket):
+    """ UDP socket that counts the Python socket methods called on it, by
+        name. Creating a socket is counted as 'socket'"""
+    calls = Counter()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        CountingSocket.calls["socket"] += 1
+
+    def setblocking(self, flag):
+        CountingSocket.calls["setblocking"] += 1
+        return super().setblocking(flag)
+
+    def connect(self, address):
+        CountingSocket.calls["connect"] += 1
+        return super().connect(address)
+
+    def sendall(self, data):
+        CountingSocket.calls["sendall"] += 1
+        return super().sendall(data)
+
+    def sendto(self, data, address):
+        CountingSocket.calls["sendto"] += 1
+        return super().sendto(data, address)
+
+    def close(self):
+        CountingSocket.calls["close"] += 1
+        return super().close()
+
+
+def method_calls_per_round():
+    """ Get the socket method calls counted by CountingSocket per round, in
+        total and by method"""
+    return {
+        "socket_method_calls_per_round": sum(CountingSocket.calls.values()) / ROUNDS,
+        "socket_methods_per_round": {name: calls / ROUNDS for name, calls in sorted(CountingSocket.calls.items())},
+    }
+
+
+def send_per_update_socket(router):
+    """ The original send path: one new connected socket per neighbour per
+        update. Sends the router's cached packets, so that only the sockets
+        differ from Router.send_forwarding_table()"""
+    router.refresh_adverts()
+    for neighbour in router.outputs:
+        sock = CountingSocket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.connect((LOCALHOST, neighbour.port))
+        for rip_packet in router.advert_packets_for(neighbour):
+            try:
+                sock.sendall(rip_packet)
+            except OSError:
+                pass
+        sock.close()
+
+
+@benchmark
+def send_sockets(num_neighbours=8, num_routes=100):
+    """ Compare the socket methods called and time per update round between a
+        new socket per neighbour and the router's persistent send socket. These
+        are calls made from Python, not a trace of the system calls they make"""
+    router = make_router(num_neighbours, num_routes)
+    results = {"neighbours": num_neighbours, "routes": num_routes, "rounds": ROUNDS}
+
+    CountingSocket.calls = Counter()
+    start = perf_counter()
+    for _ in range(ROUNDS):
+        send_per_update_socket(router)
+    results["per_update_socket"] = {
+        "seconds_per_round": (perf_counter() - start) / ROUNDS,
+        **method_calls_per_round(),
+    }
+
+    router.send_socket = CountingSocket(socket.AF_INET, socket.SOCK_DGRAM)
+    router.send_socket.setblocking(False)
+    CountingSocket.calls = Counter()
+    start = perf_counter()
+    for _ in range(ROUNDS):
+        router.send_forwarding_table()
+    results["persistent_socket"] = {
+        "seconds_per_round": (perf_counter() - start) / ROUNDS,
+        **method_calls_per_round(),
+    }
+    router.close()
+    return results
+
+
+class NullSocket:
+    """ Send socket that discards every packet"""
+    def sendto(self, data, address):
+        pass
+
+
+    def close(self):
+        pass
+
+
+@benchmark
+def advert_cache(num_neighbours=8, num_routes=1000, num_changes=10):
+    """ Compare the time to send a periodic update by encoding every route for
+        every neighbour with sending cached advertisements, both in a steady
+        state and after a few routes change"""
+    router = make_router(num_neighbours, num_routes)
+    router.send_socket = NullSocket()
+    results = {"neighbours": num_neighbours, "routes": num_routes, "rounds": ROUNDS}
+
+    start = perf_counter()
+    for _ in range(ROUNDS):
+        for neighbour in router.outputs:
+            entries = (generate_entry(*route) for route in legacy_advertised_entries(router, neighbour))
+            for rip_packet in generate_packets(2, 2, router.router_id, entries):
+                router.send_socket.sendto(rip_packet, (LOCALHOST, neighbour.port))
+    results["uncached_seconds_per_round"] = (perf_counter() - start) / ROUNDS
+
+    router.send_forwarding_table() # fill the cache
+    start = perf_counter()
+    for _ in range(ROUNDS):
+        router.send_forwarding_table()
+    results["cached_steady_seconds_per_round"] = (perf_counter() - start) / ROUNDS
+
+    destinations = list(router.forwarding_table)[:num_changes]
+    start = perf_counter()
+    for round_number in range(ROUNDS):
+        for destination in destinations:
+            router.forwarding_table[destination].metric = 2 + round_number % 2
+            router.mark_changed(destination)
+        router.send_forwarding_table()
+    results[f"cached_{num_changes}_changes_seconds_per_round"] = (perf_counter() - start) / ROUNDS
+    return results
+
+
+def table_memory(make_table, num_routes):
+    """ Measure the bytes allocated by a forwarding table filled with routes
+        that each have a next hop, metric and timeout"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    table = make_table()
+    for destination in range(num_routes):
+        table[100000 + destination] = RoutingEntry(destination % 50, None, destination % 15 + 1, 1e9 + destination, None)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size
+
+
+@benchmark
+def table_memory_usage():
+    """ Compare the memory used per route by a dict of per-route objects (the
+        original representation) with the array backed ForwardingTable"""
+    results = []
+    for num_routes in TABLE_SIZES:
+        result = {"routes": num_routes}
+        result["dict_of_entries_bytes"] = table_memory(dict, num_routes)
+        try:
+            from recordclass import recordclass
+        except ImportError:
+            pass
+        else:
+            entry_type = recordclass("RoutingEntry", "router_id port metric timeout garbage")
+            class RecordclassTable(dict):
+                def __setitem__(self, destination, entry):
+                    super().__setitem__(destination, entry_type(
+                        entry.router_id, entry.port, entry.metric, entry.timeout, entry.garbage
+                    ))
+            result["dict_of_recordclass_bytes"] = table_memory(RecordclassTable, num_routes)
+        result["forwarding_table_bytes"] = table_memory(ForwardingTable, num_routes)
+        for name in list(result):
+            if name.endswith("_bytes"):
+                result[name.replace("_bytes", "_bytes_per_route")] = result[name] / num_routes
+        results.append(result)
+    return results
+
+
+def legacy_advertised_entries(router, neighbour):
+    """ The original advertisement builder, which walks the whole forwarding
+        table for every neighbour on every update. Yields (family_id,
+        destination, metric) routes"""
+    yield (2, router.router_id, 0) # advertise self
+    for destination, table_entry in router.forwarding_table.items():
+        if table_entry.router_id == neighbour.router_id: # poisoned reverse
+            metric = INF_METRIC
+        else:
+            metric = table_entry.metric
+        if table_entry.timeout is not None: # don't send information about timed out routes
+            yield (2, destination, metric)
+
+
+def legacy_generate_entry(family_id, router_id, metric):
+    """ The original entry encoder, built from to_binary calls"""
+    return to_binary(family_id, 2, 'big') + \
+           bytearray(2) + \
+           to_binary(router_id, 4, 'big') + \
+           bytearray(8) + \
+           to_binary(metric, 4, 'big')
+
+
+def legacy_generate_packet(command, version, sender_id, entries):
+    """ The original packet encoder, built with repeated concatenation"""
+    packet = to_binary(command, 1, 'big') + \
+             to_binary(version, 1, 'big') + \
+             to_binary(sender_id, 2, 'big')
+    for entry in entries:
+        packet += entry
+    return packet
+
+
+def legacy_decode_packet(packet):
+    """ The original packet decoder, which slices out a copy of every entry"""
+    command = int.from_bytes(packet[0:1], 'big')
+    version = int.from_bytes(packet[1:2], 'big')
+    sender_id = int.from_bytes(packet[2:4], 'big')
+    entries = []
+    position = 4
+    while position < len(packet):
+        entry = packet[position:position+20]
+        entries.append((
+            int.from_bytes(entry[0:2], 'big'),
+            int.from_bytes(entry[4:8], 'big'),
+            int.from_bytes(entry[16:20], 'big'),
+        ))
+        position += 20
+    return command, version, sender_id, entries
+
+
+@benchmark
+def codec(num_packets=20000):
+    """ Compare encode and decode throughput of full 25 entry packets between the
+        original to_binary codec and the struct based codec"""
+    routes = [(2, destination, destination % INF_METRIC) for destination in range(MAX_ENTRIES)]
+    results = {"packets": num_packets, "entries_per_packet": MAX_ENTRIES}
+
+    def packets_per_second(function):
+        start = perf_counter()
+        for _ in range(num_packets):
+            function()
+        return num_packets / (perf_counter() - start)
+
+    packet = generate_packet(2, 2, 1, [generate_entry(*route) for route in routes])
+    results["encode_packets_per_second"] = {
+        "legacy": packets_per_second(lambda: legacy_generate_packet(
+            2, 2, 1, [legacy_generate_entry(*route) for route in routes])),
+        "generate_packet": packets_per_second(lambda: generate_packet(
+            2, 2, 1, [generate_entry(*route) for route in routes])),
+    }
+    results["decode_packets_per_second"] = {
+        "legacy": packets_per_second(lambda: legacy_decode_packet(packet)),
+        "decode_packet": packets_per_second(lambda: decode_packet(packet)),
+    }
+    return results
+
+
+def generate_network(num_routers):
+    """ Generate router configs for a connected network from config_builder
+        with roughly AVERAGE_DEGREE links per router"""
+    router_ids = config_builder.random_router_ids(num_routers)
+    return configs_from_adjacency(config_builder.generate_adjacency_list(router_ids, degree=AVERAGE_DEGREE))
+
+
+def time_updates(simulator, latencies):
+    """ Record the processing time of every update_forwarding_table call made
+        by the routers in a simulator"""
+    for router in simulator.routers:
+        update = router.update_forwarding_table
+        def timed_update(sender_id, entries, update=update):
+            start = perf_counter()
+            update(sender_id, entries)
+            latencies.append(perf_counter() - start)
+        router.update_forwarding_table = timed_update
+
+
+def summarise_latencies(latencies):
+    """ Summarise packet processing times in microseconds"""
+    if not latencies:
+        return None
+    latencies = sorted(latencies)
+    return {
+        "packets": len(latencies),
+        "mean_us": statistics.fmean(latencies) * 1e6,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "max_us": latencies[-1] * 1e6,
+    }
+
+
+def simulate_convergence(num_routers):
+    """ Simulate a generated network until it converges, then fail a random
+        link and simulate it until it converges again"""
+    random.seed(SEED + num_routers)
+    configs = generate_network(num_routers)
+    results = {"routers": num_routers, "links": sum(len(config[2]) for config in configs) // 2}
+
+    simulator = Simulator(configs, seed=SEED)
+    latencies = []
+    time_updates(simulator, latencies)
+    start = perf_counter()
+    converged_at = simulator.run_until_converged(CONVERGENCE_LIMIT)
+    results["convergence"] = {
+        "virtual_seconds": converged_at,
+        "wall_seconds": perf_counter() - start,
+        "packets": simulator.packets_sent,
+        "bytes": simulator.bytes_sent,
+        "update_latency": summarise_latencies(latencies),
+    }
+    if converged_at is None:
+        return results
+
+    router_id, _, outputs, _ = random.choice([config for config in configs if config[2]])
+    failed_link = (router_id, random.choice(outputs).router_id)
+    simulator.fail_link(*failed_link)
+    packets, num_bytes, failed_at = simulator.packets_sent, simulator.bytes_sent, simulator.now
+    latencies.clear()
+    start = perf_counter()
+    converged_at = simulator.run_until_converged(failed_at + CONVERGENCE_LIMIT)
+    results["reconvergence"] = {
+        "failed_link": failed_link,
+        "virtual_seconds": None if converged_at is None else converged_at - failed_at,
+        "wall_seconds": perf_counter() - start,
+        "packets": simulator.packets_sent - packets,
+        "bytes": simulator.bytes_sent - num_bytes,
+        "update_latency": summarise_latencies(latencies),
+    }
+    return results
+
+
+@benchmark
+def convergence():
+    """ Measure convergence, reconvergence after a link failure and update
+        processing time on simulated networks of increasing size"""
+    return [simulate_convergence(num_routers) for num_routers in NETWORK_SIZES]
+
+
+def main():
+    """ main"""
+    global NETWORK_SIZES, SEED
+    parser = argparse.ArgumentParser(description="Run RIP benchmarks and report JSON results")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--output", help="write results to a file instead of stdout")
+    parser.add_argument(
+        "--sizes", type=lambda sizes: [int(size) for size in sizes.split(',')],
+        default=NETWORK_SIZES, help="comma-separated network sizes for the convergence benchmark"
+    )
+    parser.add_argument("--seed", type=int, default=SEED, help="seed for generated networks")
+    args = parser.parse_args()
+    NETWORK_SIZES, SEED = args.sizes, args.seed
+
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"Error: Unknown benchmark(s): {', '.join(unknown)}")
+        sys.exit(1)
+
+    results = {name: BENCHMARKS[name]() for name in names}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Packet capture for RIP version 2 routers.
+    A router given a CaptureWriter records every datagram it receives, with
+    the time, input port and sender address, to a compact binary trace file.
+    Records go through a large write buffer, so capturing costs one struct
+    pack and a memory copy per datagram. Traces are replayed into a Router
+    with replay.py.
+    Summarise a trace with: python3 capture.py <trace>
+"""
+
+import argparse
+import socket
+import struct
+import sys
+from collections import Counter
+from packets import *
+
+TRACE_MAGIC = b"RIPC"
+TRACE_VERSION = 1
+WRITE_BUFFER = 1 << 20 # bytes buffered before a trace is written to disk
+TOP_SENDERS = 10 # senders listed in a trace summary
+
+# Precompiled layouts of the trace file
+TRACE_HEADER = struct.Struct("!4sBI") # magic, version, router id
+RECORD = struct.Struct("!dH4sHH") # time, input port, sender address, sender port, length
+
+
+class CaptureWriter:
+    """ Buffered writer of a trace of the datagrams received by one router"""
+    def __init__(self, filename, router_id):
+        try:
+            self.file = open(filename, "wb", buffering=WRITE_BUFFER)
+        except OSError as e:
+            raise Exception(f"Cannot write {filename}. {e}")
+        self.filename = filename
+        self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, router_id))
+        self.records = 0
+
+
+    def __repr__(self):
+        """ Return a string representation of a CaptureWriter object"""
+        return f"CaptureWriter({self.filename}, {self.records} records)"
+
+
+    def record(self, timestamp, port, address, data):
+        """ Append one datagram received on an input port from an address"""
+        try:
+            host = socket.inet_aton(address[0])
+        except OSError:
+            host = bytes(4)
+        self.file.write(RECORD.pack(timestamp, port, host, address[1], len(data)))
+        self.file.write(data)
+        self.records += 1
+
+
+    def close(self):
+        """ Write out buffered records and close the trace"""
+        self.file.close()
+
+
+def read_trace(filename):
+    """ Read a trace. Returns the id of the router that recorded it and a list
+        of (time, input port, (sender host, sender port), data) records"""
+    try:
+        with open(filename, "rb") as trace:
+            data = memoryview(trace.read())
+    except OSError as e:
+        raise Exception(f"Cannot read {filename}. {e}")
+    try:
+        magic, version, router_id = TRACE_HEADER.unpack_from(data)
+    except struct.error:
+        raise Exception(f"{filename} is not a trace")
+    if magic != TRACE_MAGIC:
+        raise Exception(f"{filename} is not a trace")
+    if version != TRACE_VERSION:
+        raise Exception(f"{filename} is a version {version} trace, expected version {TRACE_VERSION}")
+    records = []
+    offset = TRACE_HEADER.size
+    while offset + RECORD.size <= len(data):
+        timestamp, port, host, sender_port, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break # the router stopped part way through a record
+        records.append((timestamp, port, (socket.inet_ntoa(host), sender_port), bytes(data[offset:offset + length])))
+        offset += length
+    return router_id, records
+
+
+def main():
+    """ main"""
+    parser = argparse.ArgumentParser(description="Summarise a packet trace recorded by a RIP router")
+    parser.add_argument("trace", help="trace recorded with rip_router.py --capture")
+    args = parser.parse_args()
+    try:
+        router_id, records = read_trace(args.trace)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not records:
+        print(f"Trace of router {router_id} is empty")
+        return
+    span = records[-1][0] - records[0][0]
+    total = sum(len(data) for _, _, _, data in records)
+    print(f"Trace of router {router_id}: {len(records)} packets, {total} bytes over {span:.1f} seconds")
+    ports = Counter(port for _, port, _, _ in records)
+    senders = Counter(
+        HEADER.unpack_from(data)[2] if len(data) >= HEADER.size else None
+        for _, _, _, data in records
+    )
+    print(f"{'Port':>8}{'Packets':>10}")
+    for port, packets in sorted(ports.items()):
+        print(f"{port:>8}{packets:>10}")
+    print(f"{'Sender':>8}{'Packets':>10}")
+    for sender, packets in senders.most_common(TOP_SENDERS):
+        print(f"{'short' if sender is None else sender:>8}{packets:>10}")
+    if len(senders) > TOP_SENDERS:
+        print(f"{len(senders) - TOP_SENDERS} other senders")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,125 +1,259 @@
+"""
+Config generator for test networks of RIP version 2 routers.
+    Builds a connected topology as a sparse adjacency list, gives every link a
+    random metric and a unique port at each end, and writes one config file
+    per router. Topologies: ring, grid, tree, random (Erdos-Renyi) and
+    scale-free (Barabasi-Albert). Random and scale-free networks default to
+    an average of DEFAULT_DEGREE links per router, so they stay sparse however
+    many routers there are.
+    Usage: python3 config_builder.py [--routers N] [--topology NAME] [--degree D | --completedness F]
+"""
+
+import argparse
+import math
 import random
 from datetime import datetime
 import shutil
 import os
 
 NUM_ROUTERS = 10
-COMPLETEDNESS = 0.5
+DEFAULT_DEGREE = 4 # average links per router in random and scale-free networks
 METRIC_LOWER = 1
 METRIC_UPPER = 8
 PORT_LOWER = 1024
 PORT_UPPER = 64000
 ID_LOWER = 1
 ID_UPPER = NUM_ROUTERS * 3
+ID_LIMIT = 65535 # router ids are sent in a 16 bit header field
 CONFIG_LOCATION = "generated_config"
 DEFAULT_DELAY = 30
 DELAY_DELTA = 5
 ROUTER_TIMEOUT = 180
 GARBAGE_TIMEOUT = 300
 TRIGGER_TIMEOUT = (1,5)
+TOPOLOGIES = ("random", "tree", "ring", "grid", "scale-free")
+DEFAULT_TOPOLOGY = "random"
+MATRIX_LIMIT = 20 # largest network to print an adjacency matrix for
+
+
+def random_router_ids(count):
+    """ Pick distinct random router ids for a network of a given size"""
+    upper = min(max(count * 3, ID_UPPER), ID_LIMIT)
+    if count > upper - ID_LOWER + 1:
+        raise Exception(f"Cannot give {count} routers unique ids below {ID_LIMIT + 1}")
+    return random.sample(range(ID_LOWER, upper + 1), count)
+
+
+def tree_links(count):
+    """ Links of a random tree: each node joins a random earlier node"""
+    return [(random.randrange(node), node) for node in range(1, count)]
+
+
+def ring_links(count):
+    """ Links of a ring through every node in order"""
+    if count < 3:
+        return tree_links(count)
+    return [(node, (node + 1) % count) for node in range(count)]
+
+
+def grid_links(count):
+    """ Links of the most square grid that holds every node, filled row by row"""
+    width = math.ceil(math.sqrt(count))
+    links = []
+    for node in range(count):
+        if node % width:
+            links.append((node - 1, node))
+        if node >= width:
+            links.append((node - width, node))
+    return links
+
+
+def random_link_count(count, degree):
+    """ Number of links in a random network with an average degree"""
+    return min(max(round(count * degree / 2), count - 1), count * (count - 1) // 2)
+
+
+def random_links(count, degree=DEFAULT_DEGREE):
+    """ Links of a random tree plus uniformly random extra links, up to an
+        average degree"""
+    possible = count * (count - 1) // 2
+    target = random_link_count(count, degree)
+
+    links = tree_links(count)
+    linked = {(min(a, b), max(a, b)) for a, b in links}
+    if target - len(links) > (possible - len(links)) // 2:
+        # Dense networks: sample from the links that are left instead of
+        # rejecting random pairs that are mostly taken already
+        unused = [(a, b) for a in range(count) for b in range(a + 1, count) if (a, b) not in linked]
+        return links + random.sample(unused, target - len(links))
+    while len(linked) < target:
+        a, b = random.randrange(count), random.randrange(count)
+        if a != b and (min(a, b), max(a, b)) not in linked:
+            linked.add((min(a, b), max(a, b)))
+            links.append((a, b))
+    return links
+
+
+def scale_free_links(count, degree=DEFAULT_DEGREE):
+    """ Links of a Barabasi-Albert network: each node joins degree / 2 earlier
+        nodes, chosen in proportion to the number of links they already have"""
+    per_node = max(1, round(degree / 2))
+    links = []
+    endpoints = [0] # every node once per link it has, and the first node to start
+    for node in range(1, count):
+        targets = set()
+        while len(targets) < min(per_node, node):
+            targets.add(random.choice(endpoints))
+        for target in targets:
+            links.append((target, node))
+            endpoints.extend((target, node))
+    return links
+
+
+def count_links(count, topology=DEFAULT_TOPOLOGY, degree=DEFAULT_DEGREE):
+    """ Get the number of links generate_links() makes, without making them"""
+    if count < 2:
+        return 0
+    if topology == "random":
+        return random_link_count(count, degree)
+    if topology == "scale-free":
+        per_node = max(1, round(degree / 2))
+        return sum(min(per_node, node) for node in range(1, count))
+    if topology == "tree":
+        return count - 1
+    if topology == "ring":
+        return count if count >= 3 else count - 1
+    if topology == "grid":
+        width = math.ceil(math.sqrt(count))
+        return count - math.ceil(count / width) + max(count - width, 0)
+    raise Exception(f"Unknown topology '{topology}', expected one of {', '.join(TOPOLOGIES)}")
 
-def generate_adjacency_list(nodes):
-    adj_list = {i: {j: (None, None) for j in nodes} for i in nodes}
-    # build tree to ensure connectedness
-    tree = [nodes[0]]
-    used_ports = []
-    for i in range(len(nodes) - 1):
-        node_1 = random.choice(tree)
-        node_2 = random.choice(nodes)
-        while node_2 in tree:
-            node_2 = random.choice(nodes)            
-        
+
+def generate_links(count, topology=DEFAULT_TOPOLOGY, degree=DEFAULT_DEGREE):
+    """ Get the links of a connected topology over nodes 0 to count - 1"""
+    if topology == "random":
+        return random_links(count, degree)
+    if topology == "scale-free":
+        return scale_free_links(count, degree)
+    if topology == "tree":
+        return tree_links(count)
+    if topology == "ring":
+        return ring_links(count)
+    if topology == "grid":
+        return grid_links(count)
+    raise Exception(f"Unknown topology '{topology}', expected one of {', '.join(TOPOLOGIES)}")
+
+
+def generate_adjacency_list(nodes, topology=DEFAULT_TOPOLOGY, degree=DEFAULT_DEGREE):
+    """ Build a sparse adjacency list over a list of router ids, where
+        adj_list[a][b] holds the (metric, port) that router a uses to reach b.
+        Only linked pairs are present"""
+    # Check the network fits in the port range before building any links
+    num_links = count_links(len(nodes), topology, degree)
+    if 2 * num_links > PORT_UPPER - PORT_LOWER + 1:
+        raise Exception(
+            f"{num_links} links need more ports than {PORT_LOWER}-{PORT_UPPER} holds, "
+            f"try a lower degree"
+        )
+    links = generate_links(len(nodes), topology, degree)
+    ports = iter(random.sample(range(PORT_LOWER, PORT_UPPER + 1), 2 * len(links)))
+
+    adj_list = {node: {} for node in nodes}
+    for a, b in links:
+        node_1, node_2 = nodes[a], nodes[b]
         metric = random.randint(METRIC_LOWER, METRIC_UPPER)
-        port_1 = random.randint(PORT_LOWER, PORT_UPPER)
-        while port_1 in used_ports:
-            port_1 = random.randint(PORT_LOWER, PORT_UPPER)
-        used_ports.append(port_1)
-        port_2 = random.randint(PORT_LOWER, PORT_UPPER)
-        while port_2 in used_ports:
-            port_2 = random.randint(PORT_LOWER, PORT_UPPER)
-        used_ports.append(port_2)
-        adj_list[node_2][node_1] = (metric, port_1)
-        adj_list[node_1][node_2] = (metric, port_2)
-        tree.append(node_2)
-    
-    num_paths = len(nodes) - 1
-    
-    while num_paths < ((len(nodes) * (len(nodes)-1) / 2) * COMPLETEDNESS):
-        node_1 = random.choice(nodes)
-        node_2 = random.choice(nodes)
-        if node_1 != node_2 and adj_list[node_1][node_2][0] is None:
-            port_1 = random.randint(PORT_LOWER, PORT_UPPER)
-            while port_1 in used_ports:
-                port_1 = random.randint(PORT_LOWER, PORT_UPPER)
-            used_ports.append(port_1)
-            port_2 = random.randint(PORT_LOWER, PORT_UPPER)
-            while port_2 in used_ports:
-                port_2 = random.randint(PORT_LOWER, PORT_UPPER)
-            used_ports.append(port_2)
-            adj_list[node_2][node_1] = (metric, port_1)
-            adj_list[node_1][node_2] = (metric, port_2)
-            num_paths += 1
-    
+        adj_list[node_2][node_1] = (metric, next(ports))
+        adj_list[node_1][node_2] = (metric, next(ports))
     return adj_list
 
+
 def pretty_print(id_nums, adj_list):
     string = '# Adjacency Matrix:\n#       '
     for i in id_nums:
         string += f"{i: ^9}"
-    for i in adj_list:
+    for i in id_nums:
         string += "\n# "
         string += f"{i: <5}:"
-        for j in adj_list[i]:
-            if adj_list[i][j][0] == None:
+        for j in id_nums:
+            if j not in adj_list[i]:
                 string += '   x:x   '
             else:
                 string += f"{f'{adj_list[i][j][0]}:{adj_list[i][j][1]}': ^9}"
     return string
-    
-    
-def generate_configs():
-    id_nums = set()
-    while len(id_nums) < NUM_ROUTERS:
-        id_nums.add(random.randint(ID_LOWER, ID_UPPER))
-    id_nums = list(id_nums)
-    print(id_nums)
-    adj_list = generate_adjacency_list(id_nums)
-    print(adj_list)
-    
-    print(pretty_print(id_nums, adj_list))
+
+
+def format_config(router_id, adj_list, header):
+    """ Get the text of the config file for one router"""
+    neighbours = adj_list[router_id]
+    input_ports = [str(adj_list[neighbour_id][router_id][1]) for neighbour_id in neighbours]
+    outputs = [f"{port}-{metric}-{neighbour_id}" for neighbour_id, (metric, port) in neighbours.items()]
+    return (
+        f"{header}\n\nrouter-id {router_id}"
+        f"\n\ninput-ports {','.join(input_ports)}"
+        f"\n\noutputs {','.join(outputs)}"
+        "\n\n# Timeout params:"
+        f"\ntimeout-default {DEFAULT_DELAY}"
+        f"\ntimeout-delta {DELAY_DELTA}"
+        f"\nroute-timeout {ROUTER_TIMEOUT}"
+        f"\ngarbage-timeout {GARBAGE_TIMEOUT}"
+        f"\ntrigger-timeout {TRIGGER_TIMEOUT[0]},{TRIGGER_TIMEOUT[1]}"
+    )
+
+
+def write_configs(id_nums, adj_list, location=CONFIG_LOCATION, topology=DEFAULT_TOPOLOGY):
+    """ Replace a directory with one config file per router"""
     try:
-        shutil.rmtree(CONFIG_LOCATION)
+        shutil.rmtree(location)
     except FileNotFoundError:
         pass
-    os.mkdir(CONFIG_LOCATION)
+    os.makedirs(location)
+    header = (
+        f"# This config file was generated on {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n"
+        f"# Topology: {topology}, {len(id_nums)} routers, "
+        f"{sum(len(neighbours) for neighbours in adj_list.values()) // 2} links"
+    )
+    if len(id_nums) <= MATRIX_LIMIT:
+        header += "\n" + pretty_print(id_nums, adj_list)
     for i in id_nums:
-        with open(f"{CONFIG_LOCATION}/config_{i}.txt", 'w+') as config_file:
-            config_file.write(f"# This config file was generated on {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
-            config_file.write(pretty_print(id_nums, adj_list))
-            config_file.write(f"\n\nrouter-id {i}")
-            
-            input_ports = []
-            output_ports = []
-            
-            for neighbour_id in adj_list[i]:
-                for neighbour_neighbour in adj_list[neighbour_id]:
-                    metric, port = adj_list[neighbour_id][neighbour_neighbour]
-                    if neighbour_neighbour == i and metric is not None:
-                        input_ports.append(f"{port}")
-            
-            for neighbour_id in adj_list[i]:
-                metric, port = adj_list[i][neighbour_id]
-                if metric is not None:
-                    output_ports.append(f"{port}-{metric}-{neighbour_id}")
-            config_file.write(f"\n\ninput-ports {','.join(input_ports)}")
-            config_file.write(f"\n\noutputs {','.join(output_ports)}")
-            config_file.write("\n\n# Timeout params:")
-            config_file.write(f"\ntimeout-default {DEFAULT_DELAY}")
-            config_file.write(f"\ntimeout-delta {DELAY_DELTA}")
-            config_file.write(f"\nroute-timeout {ROUTER_TIMEOUT}")
-            config_file.write(f"\ngarbage-timeout {GARBAGE_TIMEOUT}")
-            config_file.write(f"\ntrigger-timeout {TRIGGER_TIMEOUT[0]},{TRIGGER_TIMEOUT[1]}")
+        with open(f"{location}/config_{i}.txt", 'w') as config_file:
+            config_file.write(format_config(i, adj_list, header))
+
+
+def generate_configs(num_routers=NUM_ROUTERS, topology=DEFAULT_TOPOLOGY, degree=DEFAULT_DEGREE, location=CONFIG_LOCATION):
+    id_nums = random_router_ids(num_routers)
+    adj_list = generate_adjacency_list(id_nums, topology, degree)
+    if num_routers <= MATRIX_LIMIT:
+        print(pretty_print(id_nums, adj_list))
+    write_configs(id_nums, adj_list, location, topology)
     return id_nums
-    
+
+
+def main():
+    """ main"""
+    global METRIC_LOWER, METRIC_UPPER
+    parser = argparse.ArgumentParser(description="Generate config files for a network of RIP routers")
+    parser.add_argument("--routers", type=int, default=NUM_ROUTERS, help=f"number of routers (default: {NUM_ROUTERS})")
+    parser.add_argument("--topology", choices=TOPOLOGIES, default=DEFAULT_TOPOLOGY)
+    density = parser.add_mutually_exclusive_group()
+    density.add_argument(
+        "--degree", type=float, default=DEFAULT_DEGREE,
+        help=f"average links per router for random and scale-free networks (default: {DEFAULT_DEGREE})"
+    )
+    density.add_argument("--completedness", type=float, help="fraction of every possible link to use in random networks")
+    parser.add_argument("--metrics", type=int, nargs=2, default=(METRIC_LOWER, METRIC_UPPER), metavar=("LOWER", "UPPER"))
+    parser.add_argument("--output", default=CONFIG_LOCATION, help=f"directory to write to (default: {CONFIG_LOCATION})")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    METRIC_LOWER, METRIC_UPPER = args.metrics
+    random.seed(args.seed)
+    degree = args.degree if args.completedness is None else args.completedness * (args.routers - 1)
+    try:
+        id_nums = generate_configs(args.routers, args.topology, degree, args.output)
+    except Exception as e:
+        print(f"Error: {e}")
+        return
+    print(f"Wrote {len(id_nums)} configs to {args.output}")
+
+
 if __name__ == "__main__":
-    generate_configs()
\ No newline at end of file
+    main()
@@ -0,0 +1,213 @@
+"""
+Network-wide config loading for RIP version 2 routers.
+    Parses every config file in a directory in one pass, collects the errors
+    of every file instead of stopping at the first, and checks the routers
+    against each other: router ids and input ports must be unique, and every
+    output must reach an input port of its neighbour, which must have an
+    output back. Links with a different metric in each direction are
+    reported as warnings, or as errors when checking strictly.
+    A checked network can be saved as a compact binary snapshot, which
+    routers, launchers and the simulator load in place of the directory.
+    Usage: python3 config_loader.py <config-directory> [--snapshot <file>]
+"""
+
+import argparse
+import os
+import struct
+import sys
+from packets import *
+
+CONFIG_SUFFIX = ".txt"
+SNAPSHOT_MAGIC = b"RIPN"
+SNAPSHOT_VERSION = 1
+
+# Precompiled layouts of the snapshot file
+SNAPSHOT_HEADER = struct.Struct("!4sBI") # magic, version, router count
+ROUTER_RECORD = struct.Struct("!I4d2IHH") # router id, timers, trigger range, input count, output count
+INPUT_RECORD = struct.Struct("!H") # port
+OUTPUT_RECORD = struct.Struct("!HBI") # port, metric, neighbour id
+
+
+def parse_directory(directory):
+    """ Parse and check every config file in a directory. Returns the configs,
+        in filename order, and a list of the errors found"""
+    configs = []
+    errors = []
+    try:
+        filenames = sorted(os.listdir(directory))
+    except OSError as e:
+        raise Exception(f"Cannot read {directory}. {e}")
+    for filename in filenames:
+        if filename.endswith(CONFIG_SUFFIX):
+            config_path = os.path.join(directory, filename)
+            try:
+                configs.append(check_config(parse_config(config_path)))
+            except Exception as e:
+                errors.append(f"{config_path}: {e}")
+    return configs, errors
+
+
+def cross_check(configs):
+    """ Check a network of configs against each other. Returns a list of the
+        errors found and a list of warnings"""
+    errors = []
+    warnings = []
+    routers = {}
+    port_owners = {}
+    for config in configs:
+        router_id, input_ports = config[0], config[1]
+        if router_id in routers:
+            errors.append(f"Router {router_id}: router-id is used by more than one config")
+        routers[router_id] = config
+        for port in input_ports:
+            if port in port_owners and port_owners[port] != router_id:
+                errors.append(f"Router {router_id}: input port {port} is also used by router {port_owners[port]}")
+            port_owners[port] = router_id
+
+    for router_id, _, outputs, _ in routers.values():
+        for output in outputs:
+            neighbour = routers.get(output.router_id)
+            if neighbour is None:
+                errors.append(f"Router {router_id}: output to router {output.router_id}, which has no config")
+                continue
+            if output.port not in neighbour[1]:
+                errors.append(
+                    f"Router {router_id}: output port {output.port} is not an input port of router {output.router_id}"
+                )
+            reverse = next((entry for entry in neighbour[2] if entry.router_id == router_id), None)
+            if reverse is None:
+                errors.append(f"Router {router_id}: router {output.router_id} has no output back to it")
+            elif reverse.metric != output.metric:
+                warnings.append(
+                    f"Router {router_id}: metric {output.metric} to router {output.router_id} "
+                    f"does not match the metric {reverse.metric} back"
+                )
+    return errors, warnings
+
+
+def load_directory(directory, strict=False):
+    """ Parse and cross-check a config directory, raising one Exception that
+        lists every error found. Warnings are printed, or treated as errors if
+        strict is set"""
+    configs, errors = parse_directory(directory)
+    if not configs and not errors:
+        errors.append(f"{directory}: no {CONFIG_SUFFIX} config files")
+    if not errors:
+        errors, warnings = cross_check(configs)
+        if strict:
+            errors += warnings
+        else:
+            for warning in warnings:
+                print(f"Warning: {warning}")
+    if errors:
+        raise Exception(f"{len(errors)} errors in {directory}:\n    " + "\n    ".join(errors))
+    return configs
+
+
+def write_snapshot(configs, filename):
+    """ Save a list of configs as a binary snapshot"""
+    data = bytearray(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(configs)))
+    for router_id, input_ports, outputs, timers in configs:
+        (timeout_default, timeout_delta), route_timeout, garbage_timeout, trigger_timeout = timers
+        data += ROUTER_RECORD.pack(
+            router_id, timeout_default, timeout_delta, route_timeout, garbage_timeout,
+            *trigger_timeout, len(input_ports), len(outputs)
+        )
+        for port in input_ports:
+            data += INPUT_RECORD.pack(port)
+        for output in outputs:
+            data += OUTPUT_RECORD.pack(output.port, output.metric, output.router_id)
+    with open(filename, "wb") as snapshot:
+        snapshot.write(data)
+
+
+def is_snapshot(filename):
+    """ Check whether a file is a snapshot rather than a text config"""
+    try:
+        with open(filename, "rb") as file:
+            return file.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+    except OSError:
+        return False
+
+
+def load_snapshot(filename, router_ids=None):
+    """ Load the configs saved in a snapshot, or only those of the given
+        router ids"""
+    try:
+        with open(filename, "rb") as snapshot:
+            data = memoryview(snapshot.read())
+    except OSError as e:
+        raise Exception(f"Cannot read {filename}. {e}")
+    try:
+        magic, version, count = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise Exception(f"not a version {SNAPSHOT_VERSION} snapshot")
+        offset = SNAPSHOT_HEADER.size
+        configs = []
+        for _ in range(count):
+            (router_id, timeout_default, timeout_delta, route_timeout, garbage_timeout,
+             trigger_lower, trigger_upper, input_count, output_count) = ROUTER_RECORD.unpack_from(data, offset)
+            offset += ROUTER_RECORD.size
+            end = offset + input_count * INPUT_RECORD.size
+            input_ports = [port for (port,) in INPUT_RECORD.iter_unpack(data[offset:end])]
+            offset, end = end, end + output_count * OUTPUT_RECORD.size
+            outputs = [
+                RoutingEntry(neighbour_id, port, metric, None, None)
+                for port, metric, neighbour_id in OUTPUT_RECORD.iter_unpack(data[offset:end])
+            ]
+            offset = end
+            if router_ids is None or router_id in router_ids:
+                timers = (
+                    (timeout_default, timeout_delta), route_timeout, garbage_timeout,
+                    (trigger_lower, trigger_upper),
+                )
+                configs.append((router_id, input_ports, outputs, timers))
+    except struct.error:
+        raise Exception(f"{filename} is truncated")
+    except Exception as e:
+        raise Exception(f"{filename}: {e}")
+    return configs
+
+
+def load_configs(source):
+    """ Load the configs of a network from a config directory or a snapshot"""
+    if os.path.isdir(source):
+        return load_directory(source)
+    return load_snapshot(source)
+
+
+def load_router_config(filename, router_id=None):
+    """ Load the config of a single router from a text config file, or from a
+        snapshot given the router's id"""
+    if not is_snapshot(filename):
+        return check_config(parse_config(filename))
+    if router_id is None:
+        raise Exception(f"{filename} is a snapshot, so a router id must be given")
+    configs = load_snapshot(filename, {router_id})
+    if not configs:
+        raise Exception(f"{filename} has no router {router_id}")
+    return configs[0]
+
+
+def main():
+    """ main"""
+    parser = argparse.ArgumentParser(description="Check a directory of RIP router configs as a network")
+    parser.add_argument("directory", help="directory of router config files")
+    parser.add_argument("--snapshot", help="save the checked network to this snapshot file")
+    parser.add_argument("--strict", action="store_true", help="treat warnings, such as asymmetric metrics, as errors")
+    args = parser.parse_args()
+    try:
+        configs = load_directory(args.directory, args.strict)
+        if args.snapshot is not None:
+            write_snapshot(configs, args.snapshot)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    links = sum(len(outputs) for _, _, outputs, _ in configs) // 2
+    print(f"{len(configs)} routers and {links} links checked")
+    if args.snapshot is not None:
+        print(f"Saved snapshot to {args.snapshot}")
+
+
+if __name__ == "__main__":
+    main()
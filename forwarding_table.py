@@ -0,0 +1,214 @@
+"""
+Compact forwarding table for RIP version 2 routers.
+    Routes are stored in parallel arrays, with a dictionary mapping each
+    destination to its slot in the arrays, instead of as one object per route.
+    Timers are stored as doubles, with NaN standing for None.
+    The live routes of a table can be checkpointed to a small binary file,
+    which is written to a temporary file and renamed over the previous
+    checkpoint so that a crash never leaves a partly written checkpoint.
+    Routes restored from a checkpoint and not yet confirmed keep the time they
+    were really last heard, and are marked provisional, so that restoring them
+    again does not extend their timers.
+"""
+
+import os
+import struct
+from array import array
+from math import isnan
+
+NO_TIME = float("nan")
+CHECKPOINT_MAGIC = b"RIPT"
+CHECKPOINT_VERSION = 2
+
+# Precompiled layouts of a checkpoint file
+CHECKPOINT_HEADER = struct.Struct("!4sBIdI") # magic, version, router id, time saved, route count
+CHECKPOINT_ROUTE = struct.Struct("!IIBdd?") # destination, next hop, metric, time last heard, timeout, provisional
+
+
+class Route:
+    """ View of one route in a ForwardingTable. A view is only valid until its
+        destination is popped from the table"""
+    __slots__ = ("table", "slot")
+
+    def __init__(self, table, slot):
+        self.table = table
+        self.slot = slot
+
+
+    def __repr__(self):
+        """ Return a string representation of a Route object"""
+        return (
+            f"Route(router_id={self.router_id}, metric={self.metric}, "
+            f"timeout={self.timeout}, garbage={self.garbage})"
+        )
+
+
+    @property
+    def router_id(self):
+        return self.table.next_hops[self.slot]
+
+    @router_id.setter
+    def router_id(self, value):
+        self.table.next_hops[self.slot] = value
+
+
+    @property
+    def metric(self):
+        return self.table.metrics[self.slot]
+
+    @metric.setter
+    def metric(self, value):
+        self.table.metrics[self.slot] = value
+
+
+    @property
+    def timeout(self):
+        value = self.table.timeouts[self.slot]
+        return None if isnan(value) else value
+
+    @timeout.setter
+    def timeout(self, value):
+        self.table.timeouts[self.slot] = NO_TIME if value is None else value
+
+
+    @property
+    def garbage(self):
+        value = self.table.garbages[self.slot]
+        return None if isnan(value) else value
+
+    @garbage.setter
+    def garbage(self, value):
+        self.table.garbages[self.slot] = NO_TIME if value is None else value
+
+
+class ForwardingTable:
+    """
+    Forwarding table keyed by destination router id.
+     - Supports the dictionary operations used by Router: in, len, iteration,
+       [], get(), items() and pop()
+     - Routes are returned as Route views with router_id, metric, timeout and
+       garbage attributes
+    """
+    def __init__(self):
+        self.slots = {} # destination -> index into the arrays
+        self.free_slots = []
+        self.next_hops = array('I')
+        self.metrics = array('B')
+        self.timeouts = array('d')
+        self.garbages = array('d')
+
+
+    def __repr__(self):
+        """ Return a string representation of a ForwardingTable object"""
+        return f"ForwardingTable({len(self.slots)} routes)"
+
+
+    def __len__(self):
+        return len(self.slots)
+
+
+    def __contains__(self, destination):
+        return destination in self.slots
+
+
+    def __iter__(self):
+        return iter(self.slots)
+
+
+    def __getitem__(self, destination):
+        return Route(self, self.slots[destination])
+
+
+    def __setitem__(self, destination, entry):
+        """ Store any object with router_id, metric, timeout and garbage attributes"""
+        self.add(destination, entry.router_id, entry.metric, entry.timeout, entry.garbage)
+
+
+    def get(self, destination, default=None):
+        slot = self.slots.get(destination)
+        return default if slot is None else Route(self, slot)
+
+
+    def items(self):
+        for destination, slot in self.slots.items():
+            yield destination, Route(self, slot)
+
+
+    def metric_items(self):
+        """ Yield the (destination, metric) pair of every route without
+            creating Route views"""
+        metrics = self.metrics
+        for destination, slot in self.slots.items():
+            yield destination, metrics[slot]
+
+
+    def add(self, destination, router_id, metric, timeout, garbage):
+        """ Add or replace the route to a destination"""
+        timeout = NO_TIME if timeout is None else timeout
+        garbage = NO_TIME if garbage is None else garbage
+        slot = self.slots.get(destination)
+        if slot is None and self.free_slots:
+            slot = self.free_slots.pop()
+        if slot is None:
+            self.slots[destination] = len(self.metrics)
+            self.next_hops.append(router_id)
+            self.metrics.append(metric)
+            self.timeouts.append(timeout)
+            self.garbages.append(garbage)
+        else:
+            self.slots[destination] = slot
+            self.next_hops[slot] = router_id
+            self.metrics[slot] = metric
+            self.timeouts[slot] = timeout
+            self.garbages[slot] = garbage
+
+
+    def pop(self, destination):
+        """ Remove the route to a destination"""
+        self.free_slots.append(self.slots.pop(destination))
+
+
+def write_checkpoint(filename, router_id, table, saved_at, provisional=None):
+    """ Atomically replace a checkpoint with the live routes of a table. Routes
+        that have timed out are left out. provisional maps the destinations of
+        unconfirmed routes to the time they were really last heard"""
+    provisional = provisional or {}
+    routes = []
+    for destination, slot in table.slots.items():
+        timeout = table.timeouts[slot]
+        if isnan(timeout):
+            continue
+        heard_at = provisional.get(destination)
+        routes.append(CHECKPOINT_ROUTE.pack(
+            destination, table.next_hops[slot], table.metrics[slot],
+            timeout if heard_at is None else heard_at, timeout, heard_at is not None
+        ))
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as checkpoint:
+        checkpoint.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, router_id, saved_at, len(routes)))
+        checkpoint.write(b"".join(routes))
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+    os.replace(temporary, filename)
+
+
+def read_checkpoint(filename):
+    """ Read a checkpoint. Returns the id of the router that wrote it, the time
+        it was written and a list of (destination, next hop, metric, time last
+        heard, timeout, provisional) routes"""
+    try:
+        with open(filename, "rb") as checkpoint:
+            data = checkpoint.read()
+    except OSError as e:
+        raise Exception(f"Cannot read {filename}. {e}")
+    try:
+        magic, version, router_id, saved_at, count = CHECKPOINT_HEADER.unpack_from(data)
+    except struct.error:
+        raise Exception(f"{filename} is not a checkpoint")
+    if magic != CHECKPOINT_MAGIC:
+        raise Exception(f"{filename} is not a checkpoint")
+    if version != CHECKPOINT_VERSION:
+        raise Exception(f"{filename} is a version {version} checkpoint, expected version {CHECKPOINT_VERSION}")
+    if len(data) != CHECKPOINT_HEADER.size + count * CHECKPOINT_ROUTE.size:
+        raise Exception(f"{filename} should hold {count} routes but is {len(data)} bytes long")
+    return router_id, saved_at, list(CHECKPOINT_ROUTE.iter_unpack(data[CHECKPOINT_HEADER.size:]))
@@ -0,0 +1,284 @@
+"""
+Load generator and fuzzer for RIP version 2 routers.
+    Impersonates the neighbours of a router and sends its input ports a mix of
+    valid updates, updates that churn its routes, oversized packets and
+    malformed packets at a target rate. The rate is ramped up step by step
+    while the router's metrics and response latency are watched, to find the
+    highest rate the router sustains without dropping packets or sending
+    periodic updates late. Packets the router rate limits count as dropped,
+    so run it with --rate-limit 0 to measure how fast it processes packets.
+    The router must be run with --metrics-port. If it is also run with
+    --data-plane, latency is measured with echo requests, otherwise with
+    metrics queries. Routes from valid and churn updates go to router ids
+    from FAKE_ID_BASE upwards, and are passed on to the rest of the network.
+    Usage: python3 loadgen.py <config> --metrics-port <port> [--mix valid=70,churn=20,oversized=5,malformed=5]
+"""
+
+import argparse
+import json
+import random
+import socket
+import sys
+import threading
+from time import perf_counter, sleep
+from packets import *
+from config_loader import load_router_config
+from metrics import query_metrics
+from ping import LOCALHOST, open_reply_socket, echo
+
+PACKET_KINDS = ("valid", "churn", "oversized", "malformed")
+DEFAULT_MIX = "valid=70,churn=20,oversized=5,malformed=5"
+POOL_SIZE = 1024 # packets of each kind built before sending
+FAKE_ID_BASE = 60000
+FAKE_DESTINATIONS = 100
+START_RATE = 1000
+MAX_RATE = 200000
+RAMP_FACTOR = 1.5
+MIN_STEP = 2 # seconds
+SETTLE_TIME = 0.5 # seconds to let the router catch up before reading its metrics
+SEND_INTERVAL = 0.001 # seconds between bursts of packets
+PROBE_INTERVAL = 0.05
+DROP_TOLERANCE = 0.01 # fraction of packets that may be lost or rate limited while sustained
+LATE_THRESHOLD = 0.5 # seconds a periodic update may be late while sustained
+
+
+def parse_mix(text):
+    """ Parse a mix such as 'valid=70,churn=30' into weights for each kind of
+        packet"""
+    mix = dict.fromkeys(PACKET_KINDS, 0)
+    for part in text.split(","):
+        try:
+            kind, weight = part.split("=")
+            weight = float(weight)
+        except ValueError:
+            raise Exception(f"Cannot read '{part}' of the mix, expected <kind>=<weight>")
+        if kind not in mix:
+            raise Exception(f"Unknown kind of packet '{kind}', expected one of {', '.join(PACKET_KINDS)}")
+        mix[kind] = weight
+    if sum(mix.values()) <= 0:
+        raise Exception("The mix must give at least one kind of packet a weight")
+    return mix
+
+
+def random_entries(count, metrics=None):
+    """ Encode entries to random fake destinations, with the given metric for
+        each destination or a random one"""
+    destinations = random.sample(range(FAKE_ID_BASE, FAKE_ID_BASE + FAKE_DESTINATIONS), count)
+    return [
+        generate_entry(2, destination, random.randint(1, INF_METRIC) if metrics is None else metrics[destination])
+        for destination in destinations
+    ]
+
+
+def build_packet(kind, senders, stable_metrics):
+    """ Build one packet of a kind, from a random one of the given senders"""
+    sender_id = random.choice(senders)
+    if kind == "valid":
+        # Always the same metric for each destination, so only timers change
+        return generate_packet(2, 2, sender_id, random_entries(random.randint(1, MAX_ENTRIES), stable_metrics))
+    if kind == "churn":
+        return generate_packet(2, 2, sender_id, random_entries(random.randint(1, MAX_ENTRIES)))
+    if kind == "oversized":
+        entries = random_entries(MAX_ENTRIES) + random_entries(random.randint(1, (BUF_SIZE - MAX_PACKET_SIZE) // ENTRY.size))
+        return HEADER.pack(2, 2, sender_id) + b"".join(entries)
+    fault = random.randrange(6)
+    packet = bytes(generate_packet(2, 2, sender_id, random_entries(random.randint(1, MAX_ENTRIES))))
+    if fault == 0:
+        return packet[:random.randrange(len(packet))] # truncated
+    if fault == 1:
+        return HEADER.pack(2, random.choice((0, 1, 3)), sender_id) + packet[HEADER.size:] # bad version
+    if fault == 2:
+        return HEADER.pack(random.choice((0, 1, 3)), 2, sender_id) + packet[HEADER.size:] # bad command
+    if fault == 3:
+        return HEADER.pack(2, 2, random.randrange(FAKE_ID_BASE, 65536)) + packet[HEADER.size:] # unknown sender
+    if fault == 4:
+        # Entries with bad family ids or metrics
+        return generate_packet(2, 2, sender_id, [
+            generate_entry(random.randint(0, 9), FAKE_ID_BASE, random.randint(INF_METRIC + 1, 2 ** 32 - 1))
+            for _ in range(random.randint(1, MAX_ENTRIES))
+        ])
+    return bytes(random.getrandbits(8) for _ in range(random.randint(0, BUF_SIZE)))
+
+
+def build_traffic(config, mix):
+    """ Build a shuffled pool of (packet, port) pairs to send to a router,
+        with kinds of packet in proportion to the mix"""
+    router_id, input_ports, outputs, _ = config
+    senders = [neighbour.router_id for neighbour in outputs]
+    if not senders:
+        raise Exception(f"Router {router_id} has no neighbours to impersonate")
+    stable_metrics = {
+        destination: random.randint(1, INF_METRIC - 1)
+        for destination in range(FAKE_ID_BASE, FAKE_ID_BASE + FAKE_DESTINATIONS)
+    }
+    total = sum(mix.values())
+    traffic = []
+    for kind, weight in mix.items():
+        for _ in range(round(POOL_SIZE * len(PACKET_KINDS) * weight / total)):
+            traffic.append((bytes(build_packet(kind, senders, stable_metrics)), random.choice(input_ports)))
+    random.shuffle(traffic)
+    return traffic
+
+
+class LatencyProbe(threading.Thread):
+    """ Measures the router's response time in the background, with echo
+        requests if the router forwards data packets or else with metrics
+        queries"""
+    def __init__(self, router_id, port, metrics_port):
+        super().__init__(daemon=True)
+        self.router_id = router_id
+        self.port = port
+        self.metrics_port = metrics_port
+        self.sock = open_reply_socket()
+        self.use_echo = echo(self.sock, port, router_id, DEFAULT_TTL, 0) is not None
+        self.times = []
+        self.lost = 0
+        self.stopping = threading.Event()
+
+
+    def measure(self, sequence):
+        """ Get the time of one round trip to the router, or None if it timed out"""
+        if self.use_echo:
+            reply = echo(self.sock, self.port, self.router_id, DEFAULT_TTL, sequence)
+            return None if reply is None else reply[2]
+        start = perf_counter()
+        try:
+            query_metrics(self.metrics_port)
+        except socket.timeout:
+            return None
+        return perf_counter() - start
+
+
+    def run(self):
+        sequence = 1
+        while not self.stopping.wait(PROBE_INTERVAL):
+            rtt = self.measure(sequence)
+            sequence += 1
+            if rtt is None:
+                self.lost += 1
+            else:
+                self.times.append(rtt)
+
+
+    def collect(self):
+        """ Return and reset the round trip times and losses seen so far"""
+        times, self.times = self.times, []
+        lost, self.lost = self.lost, 0
+        return times, lost
+
+
+def read_counters(metrics_port):
+    """ Get the counters of a router that show whether it is keeping up"""
+    metrics = json.loads(query_metrics(metrics_port))
+    lateness = metrics["periodic_lateness_seconds"]
+    return {
+        "received": sum(metrics["packets_received"].values()),
+        "rate_limited": sum(metrics["packets_rate_limited"].values()),
+        "malformed": sum(metrics["packets_malformed"].values()),
+        "unknown_sender": sum(metrics["packets_dropped"].values()),
+        "periodic_updates": lateness["count"],
+        "late_updates": lateness["count"] - lateness["buckets"][str(LATE_THRESHOLD)],
+    }
+
+
+def send_at_rate(sock, traffic, rate, duration):
+    """ Send packets from a pool round-robin at a rate for a number of seconds.
+        Returns the number of packets sent"""
+    sent = 0
+    start = perf_counter()
+    now = start
+    while now - start < duration:
+        due = int((now - start) * rate)
+        while sent < due:
+            packet, port = traffic[sent % len(traffic)]
+            try:
+                sock.sendto(packet, (LOCALHOST, port))
+            except OSError:
+                pass # a full send buffer counts as a drop
+            sent += 1
+        sleep(SEND_INTERVAL)
+        now = perf_counter()
+    return sent
+
+
+def ramp(config, metrics_port, mix, start_rate, max_rate, factor, step):
+    """ Send traffic at increasing rates until the router stops keeping up,
+        printing the results of each step. Returns the highest rate sustained"""
+    router_id, input_ports = config[0], config[1]
+    traffic = build_traffic(config, mix)
+    probe = LatencyProbe(router_id, input_ports[0], metrics_port)
+    print(f"Measuring latency with {'echo requests' if probe.use_echo else 'metrics queries'}")
+    print(f"{'Rate':>9}{'Sent':>9}{'Lost':>7}{'Limited':>9}{'Late':>6}{'RTT median':>12}{'RTT p99':>10}")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.start()
+    sustained = None
+    rate = start_rate
+    try:
+        while rate <= max_rate:
+            before = read_counters(metrics_port)
+            probe.collect()
+            sent = send_at_rate(sock, traffic, rate, step)
+            sleep(SETTLE_TIME)
+            times, probes_lost = probe.collect()
+            after = read_counters(metrics_port)
+
+            # Echo probes are received by the router as well as the traffic
+            probes = len(times) + probes_lost if probe.use_echo else 0
+            lost = max(sent - (after["received"] - before["received"] - probes), 0)
+            limited = after["rate_limited"] - before["rate_limited"]
+            late = after["late_updates"] - before["late_updates"]
+            times.sort()
+            median = f"{times[len(times) // 2] * 1000:.2f} ms" if times else "-"
+            p99 = f"{times[int(len(times) * 0.99)] * 1000:.2f} ms" if times else "-"
+            print(
+                f"{rate:>9.0f}{sent:>9}{lost:>7}{limited:>9}"
+                f"{late:>6}{median:>12}{p99:>10}"
+            )
+            if lost + limited > sent * DROP_TOLERANCE or late > 0:
+                break
+            sustained = rate
+            rate *= factor
+    finally:
+        probe.stopping.set()
+        sock.close()
+    return sustained
+
+
+def main():
+    """ main"""
+    parser = argparse.ArgumentParser(description="Find the highest packet rate a RIP router sustains")
+    parser.add_argument("config", help="config file of the router under test, or a network snapshot")
+    parser.add_argument("--router-id", type=int, help="router to test from a snapshot")
+    parser.add_argument("--metrics-port", type=int, required=True, help="metrics port the router was started with")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weights of each kind of packet (default: {DEFAULT_MIX})")
+    parser.add_argument("--start-rate", type=float, default=START_RATE, help=f"packets per second of the first step (default: {START_RATE})")
+    parser.add_argument("--max-rate", type=float, default=MAX_RATE, help=f"highest packets per second to try (default: {MAX_RATE})")
+    parser.add_argument("--factor", type=float, default=RAMP_FACTOR, help=f"rate increase between steps (default: {RAMP_FACTOR})")
+    parser.add_argument(
+        "--step", type=float,
+        help="seconds per step (default: long enough for one periodic update)"
+    )
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    try:
+        config = load_router_config(args.config, args.router_id)
+        mix = parse_mix(args.mix)
+        read_counters(args.metrics_port)
+    except socket.timeout:
+        print(f"Error: No response from metrics port {args.metrics_port}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    (timeout_default, timeout_delta) = config[3][0]
+    step = args.step if args.step is not None else max(timeout_default + timeout_delta, MIN_STEP)
+    sustained = ramp(config, args.metrics_port, mix, args.start_rate, args.max_rate, args.factor, step)
+    if sustained is None:
+        print(f"Router {config[0]} did not keep up with {args.start_rate:.0f} packets per second")
+    else:
+        print(f"Router {config[0]} sustained {sustained:.0f} packets per second")
+
+
+if __name__ == "__main__":
+    main()
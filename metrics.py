@@ -0,0 +1,158 @@
+"""
+Metrics for RIP version 2 routers.
+    Each router counts packets, route changes and updates in a RouterMetrics
+    object. Counting is a dictionary or attribute increment; latency histograms
+    are only collected once a router is given a query port, except for the
+    lateness of periodic updates, which is observed once per update. A
+    histogram set to None is left out of the output, as select_seconds is by
+    routers run on an asyncio event loop, which cannot time its waits.
+    Query a running router with: python3 metrics.py <metrics-port> [--format prometheus]
+    Profile a running router with: python3 metrics.py <metrics-port> --profile start|stop|snapshot
+"""
+
+import argparse
+import json
+import socket
+import sys
+from bisect import bisect_left
+from collections import defaultdict
+from profiler import PROFILE_COMMANDS
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+QUERY_FORMATS = ("json", "prometheus")
+QUERY_TIMEOUT = 1
+PROFILE_TIMEOUT = 30 # seconds to wait for a profiler to write its results
+MAX_RESPONSE_SIZE = 65507
+
+
+class Histogram:
+    """ Fixed-bucket histogram of durations in seconds"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value):
+        """ Record a single duration"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def to_dict(self):
+        """ Return the histogram as a JSON-friendly dictionary of cumulative
+            bucket counts"""
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class RouterMetrics:
+    """ Counters and histograms for a single router"""
+    PORT_COUNTERS = ("packets_received", "packets_dropped", "packets_malformed", "packets_rate_limited")
+    COUNTERS = (
+        "routes_added", "routes_changed", "routes_timed_out", "routes_removed",
+        "routes_restored", "routes_confirmed", "table_checkpoints",
+        "periodic_updates_sent", "triggered_updates_sent", "triggered_updates_suppressed",
+        "receive_batches", "entries_invalid",
+        "data_forwarded", "data_delivered", "data_expired", "data_unreachable",
+    )
+    HISTOGRAMS = ("decode_seconds", "update_seconds", "select_seconds", "periodic_lateness_seconds")
+
+    def __init__(self, router_id):
+        self.router_id = router_id
+        self.timing = False # collect latency histograms
+        for name in self.PORT_COUNTERS:
+            setattr(self, name, defaultdict(int))
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        for name in self.HISTOGRAMS:
+            setattr(self, name, Histogram())
+
+
+    def to_dict(self):
+        """ Return every metric as a JSON-friendly dictionary"""
+        metrics = {"router_id": self.router_id}
+        for name in self.PORT_COUNTERS:
+            metrics[name] = {str(port): value for port, value in getattr(self, name).items()}
+        for name in self.COUNTERS:
+            metrics[name] = getattr(self, name)
+        for name in self.HISTOGRAMS:
+            histogram = getattr(self, name)
+            if histogram is not None:
+                metrics[name] = histogram.to_dict()
+        return metrics
+
+
+    def to_json(self):
+        """ Return every metric as JSON"""
+        return json.dumps(self.to_dict())
+
+
+    def to_prometheus(self):
+        """ Return every metric in the Prometheus text exposition format"""
+        router = f'router="{self.router_id}"'
+        lines = []
+        for name in self.PORT_COUNTERS:
+            lines.append(f"# TYPE rip_{name}_total counter")
+            for port, value in getattr(self, name).items():
+                lines.append(f'rip_{name}_total{{{router},port="{port}"}} {value}')
+        for name in self.COUNTERS:
+            lines.append(f"# TYPE rip_{name}_total counter")
+            lines.append(f"rip_{name}_total{{{router}}} {getattr(self, name)}")
+        for name in self.HISTOGRAMS:
+            if getattr(self, name) is None:
+                continue
+            histogram = getattr(self, name).to_dict()
+            lines.append(f"# TYPE rip_{name} histogram")
+            for bound, count in histogram["buckets"].items():
+                lines.append(f'rip_{name}_bucket{{{router},le="{bound}"}} {count}')
+            lines.append(f"rip_{name}_sum{{{router}}} {histogram['sum']}")
+            lines.append(f"rip_{name}_count{{{router}}} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+    def render(self, query):
+        """ Render the metrics in the format named by a query"""
+        if query.strip().lower() == "prometheus":
+            return self.to_prometheus()
+        return self.to_json()
+
+
+def query_metrics(port, query_format="json", host="127.0.0.1", timeout=QUERY_TIMEOUT):
+    """ Ask a running router for its metrics and return the response text"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(timeout)
+    try:
+        sock.sendto(query_format.encode(), (host, port))
+        data, _ = sock.recvfrom(MAX_RESPONSE_SIZE)
+    finally:
+        sock.close()
+    return data.decode()
+
+
+def main():
+    """ main"""
+    parser = argparse.ArgumentParser(description="Query the metrics of a running RIP router")
+    parser.add_argument("port", type=int, help="metrics port of the router")
+    parser.add_argument("--format", choices=QUERY_FORMATS, default="json")
+    parser.add_argument("--profile", choices=PROFILE_COMMANDS, help="start or stop the router's profiler, or take a memory snapshot")
+    args = parser.parse_args()
+    try:
+        if args.profile is not None:
+            print(query_metrics(args.port, f"profile {args.profile}", timeout=PROFILE_TIMEOUT))
+        else:
+            print(query_metrics(args.port, args.format))
+    except socket.timeout:
+        print(f"Error: No response from port {args.port}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,53 @@ Max Croucher
 23 Feb, 2023
 """
 
-from recordclass import recordclass
+import struct
+from itertools import islice
 
 COMMENT_CHAR = "#"
 RIP_VERSION = 2
+RESPONSE_COMMAND = 2
+ADDRESS_FAMILY = 2 # the family id of every RIP entry
 BUF_SIZE = 1024
 INF_METRIC = 16
+MAX_ENTRIES = 25
+
+# Precompiled layouts of the RIP header and of a 20 byte RIP entry
+HEADER = struct.Struct("!BBH") # command, version, sender id
+ENTRY = struct.Struct("!H2xI8xI") # family id, router id, metric
+MAX_PACKET_SIZE = HEADER.size + MAX_ENTRIES * ENTRY.size
+
+# Data packets share the first four bytes of the RIP header, with a command
+# that is not used by RIP, so routers can tell them apart from updates
+DATA_COMMAND = 100
+DATA_COMMAND_BYTE = bytes([DATA_COMMAND])
+DATA_HEADER = struct.Struct("!BBHIBBHId") # command, version, sender id, destination, ttl, kind, reply port, sequence, sent time
+DATA_TTL_OFFSET = 8
+DEFAULT_TTL = 64
+ECHO_REQUEST = 0
+ECHO_REPLY = 1
+TTL_EXCEEDED = 2
+UNREACHABLE = 3
+
+
+
+class RoutingEntry:
+    """ A neighbour from a config file, or a single route"""
+    __slots__ = ("router_id", "port", "metric", "timeout", "garbage")
+
+    def __init__(self, router_id, port, metric, timeout, garbage):
+        self.router_id = router_id
+        self.port = port
+        self.metric = metric
+        self.timeout = timeout
+        self.garbage = garbage
+
+    def __repr__(self):
+        return (
+            f"RoutingEntry(router_id={self.router_id}, port={self.port}, metric={self.metric}, "
+            f"timeout={self.timeout}, garbage={self.garbage})"
+        )
 
-RoutingEntry = recordclass("RoutingEntry", "router_id port metric timeout garbage")
 
 
 def to_binary(value, size, endian):
@@ -24,46 +63,71 @@ def to_binary(value, size, endian):
 
 def generate_entry(family_id, router_id, metric):
     """ Takes and IP address and metric as integers and returns an RIP entry
-        as a bytearray"""
-    return to_binary(family_id, 2, 'big') + \
-           bytearray(2) + \
-           to_binary(router_id, 4, 'big') + \
-           bytearray(8) + \
-           to_binary(metric, 4, 'big')
+        as a bytes object"""
+    return ENTRY.pack(family_id, router_id, metric)
 
 def generate_packet(command, version, sender_id, entries):
     """ Takes the type and version of an RIP packet and up to 25 entries.
         returns a complete RIP packet as a bytearray"""
     if len(entries) == 0:
         raise Exception("At least one entry must be provided.")
-    elif len(entries) > 25:
+    elif len(entries) > MAX_ENTRIES:
         raise Exception("Too many entries have been provided.")
-    packet = to_binary(command, 1, 'big') + \
-             to_binary(version, 1, 'big') + \
-             to_binary(sender_id, 2, 'big')
+    packet = bytearray(HEADER.size + sum(len(entry) for entry in entries))
+    HEADER.pack_into(packet, 0, command, version, sender_id)
+    position = HEADER.size
     for entry in entries:
-        packet += entry
+        packet[position:position + len(entry)] = entry
+        position += len(entry)
     return packet
 
-def decode_entry(entry):
-    """ Takes an RIP entry and returns the stored fields"""
-    family_id = int.from_bytes(entry[0:2], 'big')
-    router_id = int.from_bytes(entry[4:8], 'big')
-    metric = int.from_bytes(entry[16:20], 'big')
-    return family_id, router_id, metric
+def generate_packets(command, version, sender_id, entries):
+    """ Takes the type and version of an RIP packet and any number of entries.
+        Yields as many complete RIP packets as are needed to carry every entry,
+        with at most 25 entries in each"""
+    entries = iter(entries)
+    chunk = list(islice(entries, MAX_ENTRIES))
+    while chunk:
+        yield generate_packet(command, version, sender_id, chunk)
+        chunk = list(islice(entries, MAX_ENTRIES))
+
+def split_packets(command, version, sender_id, body):
+    """ Takes the type and version of an RIP packet and any number of encoded
+        entries joined into one bytes object. Returns the complete RIP packets
+        carrying them, with at most 25 entries in each"""
+    header = HEADER.pack(command, version, sender_id)
+    step = MAX_ENTRIES * ENTRY.size
+    return [header + body[position:position + step] for position in range(0, len(body), step)]
+
+def pack_data(sender_id, destination, ttl, kind, reply_port, sequence, sent_time, payload=b""):
+    """ Takes the fields of a data packet and returns the packet. Replies are
+        sent to reply_port on localhost, and carry the sequence number and sent
+        time of the packet they answer"""
+    return DATA_HEADER.pack(
+        DATA_COMMAND, RIP_VERSION, sender_id, destination, ttl, kind, reply_port, sequence, sent_time
+    ) + payload
+
+def decode_data(packet):
+    """ Takes a data packet and returns its header fields: command, version,
+        sender id, destination, ttl, kind, reply port, sequence and sent time"""
+    return DATA_HEADER.unpack_from(packet)
+
+def decode_header(packet):
+    """ Takes a recieved RIP packet and returns the command, version and sender
+        id from its header without decoding any entries"""
+    return HEADER.unpack_from(packet)
+
+def decode_entries(packet):
+    """ Takes a recieved RIP packet and returns its stored entries"""
+    view = memoryview(packet)
+    if (len(view) - HEADER.size) % ENTRY.size != 0:
+        raise Exception("Packet does not contain a whole number of entries.")
+    return list(ENTRY.iter_unpack(view[HEADER.size:]))
 
 def decode_packet(packet):
     """ Takes a recieved RIP packet returns the parameters and stored entries"""
-    command = int.from_bytes(packet[0:1], 'big')
-    version = int.from_bytes(packet[1:2], 'big')
-    sender_id = int.from_bytes(packet[2:4], 'big')
-    entries = []
-    position = 4 # starting index for RIP entries
-    while position < len(packet):
-        entry = packet[position:position+20]
-        entries.append(decode_entry(entry))
-        position += 20
-    return command, version, sender_id, entries
+    command, version, sender_id = decode_header(packet)
+    return command, version, sender_id, decode_entries(packet)
 
 """
 Config File Specifications:
@@ -1,5 +1,34 @@
-from packets import *
+"""
+Test traffic for RIP version 2 routers.
+    Sends a hand-made RIP update to a router, or sends data packets through a
+    network of routers running with --data-plane to measure the round trip
+    time to a destination, the latency to each hop on the way to it, or the
+    packets per second that the path sustains.
+    Data packets are sent to an input port of the first router, and replies
+    come back to a local port opened by this tool.
+    Usage: python3 ping.py <port> <destination-id> [--count N]
+           python3 ping.py <port> <destination-id> --trace
+           python3 ping.py <port> <destination-id> --flood <seconds> [--rate <packets-per-second>]
+           python3 ping.py --test-update [<port>]
+"""
+
+import argparse
+import select
 import socket
+import statistics
+import sys
+from time import perf_counter, sleep
+from packets import *
+
+LOCALHOST = "127.0.0.1"
+TEST_PORT = 61110
+REPLY_TIMEOUT = 1
+MAX_HOPS = 30
+PROBES_PER_HOP = 3
+FLOOD_WINDOW = 64 # most packets in flight at once while flooding
+TOOL_ID = 0 # sender id of packets from this tool
+REPLY_NAMES = {ECHO_REPLY: "reply", TTL_EXCEEDED: "ttl exceeded", UNREACHABLE: "unreachable"}
+
 
 def ping(port, packet):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # Initialise UDP socket
@@ -8,4 +37,169 @@ def ping(port, packet):
     sock.connect((address, port)) # attempt to connect to server
     sock.sendall(packet) # send dt_request
 
-ping(61110, generate_packet(2, 2, 1, [generate_entry(2, 1, 3), generate_entry(6, 3, 0), generate_entry(3, 5, 2), generate_entry(1, 2, 5)]))
\ No newline at end of file
+
+def send_test_update(port=TEST_PORT):
+    """ Send an update with entries of bad family ids and metrics to a router"""
+    ping(port, generate_packet(2, 2, 1, [generate_entry(2, 1, 3), generate_entry(6, 3, 0), generate_entry(3, 5, 2), generate_entry(1, 2, 5)]))
+
+
+def open_reply_socket():
+    """ Open a socket on a free local port to send data packets from and
+        receive their replies on"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((LOCALHOST, 0))
+    sock.settimeout(REPLY_TIMEOUT)
+    return sock
+
+
+def echo(sock, port, destination, ttl, sequence):
+    """ Send one echo request and wait for its reply. Returns the kind of
+        reply, the id of the router that sent it and the round trip time in
+        seconds, or None if no reply came"""
+    reply_port = sock.getsockname()[1]
+    sock.sendto(pack_data(TOOL_ID, destination, ttl, ECHO_REQUEST, reply_port, sequence, perf_counter()), (LOCALHOST, port))
+    while True:
+        try:
+            data, _ = sock.recvfrom(BUF_SIZE)
+        except socket.timeout:
+            return None
+        _, _, router_id, _, _, kind, _, reply_sequence, sent_time = decode_data(data)
+        if reply_sequence == sequence:
+            return kind, router_id, perf_counter() - sent_time
+
+
+def ping_destination(port, destination, count, interval=1.0):
+    """ Send echo requests to a destination and print the round trip times"""
+    sock = open_reply_socket()
+    times = []
+    for sequence in range(count):
+        reply = echo(sock, port, destination, DEFAULT_TTL, sequence)
+        if reply is None:
+            print(f"{sequence}: no reply")
+        else:
+            kind, router_id, rtt = reply
+            if kind == ECHO_REPLY:
+                times.append(rtt)
+            print(f"{sequence}: {REPLY_NAMES.get(kind, kind)} from router {router_id} in {rtt * 1000:.3f} ms")
+        if sequence < count - 1:
+            sleep(interval)
+    sock.close()
+    print(f"{count} sent, {len(times)} replies, {100 * (count - len(times)) / count:.0f}% lost")
+    if times:
+        print(f"Round trip min/avg/max: {min(times) * 1000:.3f}/{statistics.mean(times) * 1000:.3f}/{max(times) * 1000:.3f} ms")
+
+
+def trace(port, destination, max_hops=MAX_HOPS, probes=PROBES_PER_HOP):
+    """ Print the router at each hop towards a destination and the round trip
+        time to it"""
+    sock = open_reply_socket()
+    sequence = 0
+    for ttl in range(1, max_hops + 1):
+        hop_id = None
+        times = []
+        done = False
+        for _ in range(probes):
+            reply = echo(sock, port, destination, ttl, sequence)
+            sequence += 1
+            if reply is None:
+                continue
+            kind, hop_id, rtt = reply
+            times.append(f"{rtt * 1000:.3f} ms")
+            done = kind != TTL_EXCEEDED
+        print(f"{ttl:>3}  {'*' if hop_id is None else f'router {hop_id}':<12}  {'  '.join(times) or '*'}")
+        if done:
+            break
+    sock.close()
+
+
+def flood(port, destination, duration, rate=None, window=FLOOD_WINDOW):
+    """ Send echo requests to a destination for a number of seconds, as fast
+        as replies come back or at a fixed rate, and print the packets per
+        second sustained and the round trip times"""
+    sock = open_reply_socket()
+    sock.setblocking(False)
+    reply_port = sock.getsockname()[1]
+    address = (LOCALHOST, port)
+    times = []
+    sent = lost = 0
+    start = last_reply = now = perf_counter()
+    end = start + duration
+    while now < end:
+        in_flight = sent - len(times) - lost
+        if in_flight >= window:
+            if now - last_reply > REPLY_TIMEOUT:
+                lost += in_flight # give up on packets that were dropped
+            wait = REPLY_TIMEOUT
+        elif rate is None or sent < (now - start) * rate:
+            sock.sendto(pack_data(TOOL_ID, destination, DEFAULT_TTL, ECHO_REQUEST, reply_port, sent, now), address)
+            sent += 1
+            wait = 0
+        else:
+            wait = (sent + 1) / rate - (now - start) # until the next packet is due
+        if wait > 0:
+            select.select([sock], [], [], min(wait, end - now))
+        try:
+            while True:
+                data, _ = sock.recvfrom(BUF_SIZE)
+                _, _, _, _, _, kind, _, _, sent_time = decode_data(data)
+                if kind == ECHO_REPLY:
+                    last_reply = perf_counter()
+                    times.append(last_reply - sent_time)
+        except BlockingIOError:
+            pass
+        now = perf_counter()
+    elapsed = now - start
+
+    # Collect replies still in flight
+    sock.settimeout(REPLY_TIMEOUT)
+    try:
+        while len(times) + lost < sent:
+            data, _ = sock.recvfrom(BUF_SIZE)
+            _, _, _, _, _, kind, _, _, sent_time = decode_data(data)
+            if kind == ECHO_REPLY:
+                times.append(perf_counter() - sent_time)
+    except socket.timeout:
+        pass
+    sock.close()
+
+    print(f"{sent} sent, {len(times)} replies in {elapsed:.2f} seconds")
+    print(f"Sustained {len(times) / elapsed:.0f} packets per second to router {destination}")
+    if times:
+        times.sort()
+        print(
+            f"Round trip median/p99/max: {times[len(times) // 2] * 1000:.3f}/"
+            f"{times[int(len(times) * 0.99)] * 1000:.3f}/{times[-1] * 1000:.3f} ms"
+        )
+
+
+def main():
+    """ main"""
+    parser = argparse.ArgumentParser(description="Send test traffic through RIP routers")
+    parser.add_argument("port", type=int, nargs="?", help="input port of the first router")
+    parser.add_argument("destination", type=int, nargs="?", help="router id to send data packets to")
+    parser.add_argument("--count", type=int, default=4, help="echo requests to send (default: 4)")
+    parser.add_argument("--trace", action="store_true", help="show the latency to each hop towards the destination")
+    parser.add_argument("--flood", type=float, metavar="SECONDS", help="measure the packets per second the path sustains")
+    parser.add_argument("--rate", type=float, help="packets per second to send with --flood (default: as fast as replies come back)")
+    parser.add_argument("--test-update", action="store_true", help=f"send a hand-made RIP update instead (default port: {TEST_PORT})")
+    args = parser.parse_args()
+
+    if args.test_update:
+        send_test_update(args.port if args.port is not None else TEST_PORT)
+        return
+    if args.port is None or args.destination is None:
+        parser.error("give the port of the first router and a destination router id")
+    try:
+        if args.trace:
+            trace(args.port, args.destination)
+        elif args.flood is not None:
+            flood(args.port, args.destination, args.flood, args.rate)
+        else:
+            ping_destination(args.port, args.destination, args.count)
+    except OSError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+On-demand profiling for running RIP version 2 routers.
+    A Profiler is attached to the routers of one process and does nothing
+    until it is started, by SIGUSR1 or by a 'profile start' query on a
+    router's metrics port. While running it collects a cProfile profile,
+    traces memory allocations with tracemalloc, and times the sections of
+    each router's loop: waiting in select, decoding datagrams, updating the
+    forwarding table, expiring routes and sending updates. Sections are timed
+    by wrapping the routers' methods only while profiling, so a router that
+    is not being profiled runs exactly as it would without a Profiler.
+    Stopping the profiler, by SIGUSR1 again or 'profile stop', writes
+        <name>-<time>.prof        cProfile stats, for pstats or snakeviz
+        <name>-<time>.sections    time spent in each section of the loop
+        <name>-<time>.tracemalloc allocations, for tracemalloc.Snapshot.load()
+    to its directory. SIGUSR2 or 'profile snapshot' writes an extra
+    tracemalloc snapshot while profiling, to compare against later ones.
+    Usage: kill -USR1 <pid>, or python3 metrics.py <metrics-port> --profile start
+"""
+
+import cProfile
+import os
+import signal
+import tracemalloc
+from time import perf_counter, strftime
+
+DEFAULT_PROFILE_DIR = "router_profiles"
+PROFILE_COMMANDS = ("start", "stop", "snapshot")
+TRACEMALLOC_FRAMES = 10 # stack frames recorded for each allocation
+
+# Router methods timed as each section of the loop. Waiting in select is
+# taken from the select_seconds histograms of the routers, which routers in a
+# RouterFarm share and routers run on an asyncio event loop do not have
+SECTIONS = (
+    ("decode", "decode_datagram"),
+    ("update", "update_forwarding_table"),
+    ("update", "update_forwarding_table_batch"),
+    ("expiry", "check_router_down"),
+    ("send", "send_forwarding_table"),
+)
+
+
+class Profiler:
+    """
+    Profiles the routers of one process on demand.
+     - Create with the routers to profile, the directory to write results to
+       and a name for the result files
+     - Control with install_signals() and Router.profile_command(), or call
+       start(), stop() and snapshot() directly
+    """
+    def __init__(self, routers, directory=DEFAULT_PROFILE_DIR, name="router"):
+        self.routers = routers
+        self.directory = directory
+        self.name = name
+        self.profile = None # the running cProfile.Profile, None while stopped
+        self.started = 0
+        self.stamp = None # time the current run started, for naming its files
+        self.tracing = False # tracemalloc was started by this profiler
+        self.sections = {} # [calls, seconds] of each section
+        self.select_start = {} # (count, sum) of each select_seconds histogram at start
+        self.timing = {} # metrics.timing of each router before profiling
+        self.snapshots = 0
+        for router in routers:
+            router.profiler = self
+
+
+    def __repr__(self):
+        """ Return a string representation of a Profiler object"""
+        return f"Profiler({self.name}, {'running' if self.running else 'stopped'})"
+
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+
+    def filename(self, suffix):
+        """ Get the path of a result file for the current profiling run"""
+        return os.path.join(self.directory, f"{self.name}-{self.stamp}{suffix}")
+
+
+    def timed(self, section, method):
+        """ Wrap a bound method so that its calls are added to a section"""
+        totals = self.sections.setdefault(section, [0, 0.0])
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                totals[0] += 1
+                totals[1] += perf_counter() - start
+        return wrapper
+
+
+    def start(self):
+        """ Start profiling every router. Returns a message describing what
+            was done"""
+        if self.running:
+            return "Already profiling"
+        os.makedirs(self.directory, exist_ok=True)
+        self.sections = {}
+        for router in self.routers:
+            for section, method in SECTIONS:
+                setattr(router, method, self.timed(section, getattr(router, method)))
+            self.timing[router] = router.metrics.timing
+            router.metrics.timing = True
+            histogram = router.metrics.select_seconds
+            if histogram is not None and histogram not in self.select_start:
+                self.select_start[histogram] = (histogram.count, histogram.sum)
+        self.tracing = not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.stamp = strftime("%Y%m%d-%H%M%S")
+        self.snapshots = 0
+        self.started = perf_counter()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return f"Profiling {len(self.routers)} router(s)"
+
+
+    def stop(self):
+        """ Stop profiling and write the results. Returns a message naming the
+            files written"""
+        if not self.running:
+            return "Not profiling"
+        self.profile.disable()
+        elapsed = perf_counter() - self.started
+        for router in self.routers:
+            for _, method in SECTIONS:
+                router.__dict__.pop(method, None) # back to the unwrapped method
+            router.metrics.timing = self.timing.pop(router)
+
+        stats_file = self.filename(".prof")
+        self.profile.dump_stats(stats_file)
+        self.profile = None
+        sections_file = self.filename(".sections")
+        with open(sections_file, "w") as output:
+            output.write(self.format_sections(elapsed))
+        snapshot_file = self.filename(".tracemalloc")
+        tracemalloc.take_snapshot().dump(snapshot_file)
+        if self.tracing:
+            tracemalloc.stop()
+        return f"Wrote {stats_file}, {sections_file} and {snapshot_file}"
+
+
+    def toggle(self):
+        """ Start profiling if stopped, otherwise stop and write the results"""
+        return self.stop() if self.running else self.start()
+
+
+    def snapshot(self):
+        """ Write a tracemalloc snapshot of the allocations made since
+            profiling started"""
+        if not self.running:
+            return "Not profiling, start profiling to trace allocations"
+        self.snapshots += 1
+        snapshot_file = self.filename(f"-{self.snapshots}.tracemalloc")
+        tracemalloc.take_snapshot().dump(snapshot_file)
+        return f"Wrote {snapshot_file}"
+
+
+    def format_sections(self, elapsed):
+        """ Format the time spent in each section of the routers' loops over
+            a profiling run of elapsed seconds"""
+        totals = dict(self.sections)
+        select_calls = 0
+        select_seconds = 0.0
+        for histogram, (count, seconds) in self.select_start.items():
+            select_calls += histogram.count - count
+            select_seconds += histogram.sum - seconds
+        self.select_start = {}
+        if select_calls:
+            totals["select"] = [select_calls, select_seconds]
+        timed = sum(seconds for _, seconds in totals.values())
+        totals["other"] = [0, max(elapsed - timed, 0.0)]
+
+        lines = [
+            f"Profiled routers {', '.join(str(router.router_id) for router in self.routers)} for {elapsed:.3f} seconds",
+            f"{'Section':<10}{'Calls':>10}{'Seconds':>12}{'Mean us':>12}{'Share':>8}",
+        ]
+        for section in ("select", "decode", "update", "expiry", "send", "other"):
+            if section not in totals:
+                continue
+            calls, seconds = totals[section]
+            mean = f"{seconds / calls * 1e6:.1f}" if calls else "-"
+            share = seconds / elapsed * 100 if elapsed else 0
+            lines.append(f"{section:<10}{calls:>10}{seconds:>12.4f}{mean:>12}{share:>7.1f}%")
+        if "select" not in totals:
+            lines.append("Waiting for packets is counted in other, as these routers run on an asyncio event loop")
+        return "\n".join(lines) + "\n"
+
+
+    def command(self, command):
+        """ Run a 'start', 'stop' or 'snapshot' command. Returns a message
+            describing what was done"""
+        if command == "start":
+            return self.start()
+        if command == "stop":
+            return self.stop()
+        if command == "snapshot":
+            return self.snapshot()
+        return f"Unknown profile command '{command}', expected one of {', '.join(PROFILE_COMMANDS)}"
+
+
+    def handle_signal(self, signum, frame):
+        """ Signal handler toggling profiling on SIGUSR1 and taking a
+            tracemalloc snapshot on SIGUSR2"""
+        message = self.toggle() if signum == signal.SIGUSR1 else self.snapshot()
+        if self.routers:
+            self.routers[0].logger.info(message)
+
+
+    def install_signals(self):
+        """ Control the profiler with SIGUSR1 and SIGUSR2"""
+        signal.signal(signal.SIGUSR1, self.handle_signal)
+        signal.signal(signal.SIGUSR2, self.handle_signal)
@@ -0,0 +1,44 @@
+"""
+Token bucket rate limiting for RIP version 2 routers.
+    Each bucket holds up to burst tokens and refills at rate tokens per second.
+    A packet is admitted only if it can take a whole token, so a sender can
+    send bursts of up to burst packets but no more than rate packets per second
+    over time.
+"""
+
+
+class TokenBucket:
+    """ Token bucket for the packets of one sender on one port"""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+
+    def __repr__(self):
+        """ Return a string representation of a TokenBucket object"""
+        return f"TokenBucket({self.tokens:.1f}/{self.burst} tokens, {self.rate}/s)"
+
+
+    def take(self, now):
+        """ Refill the bucket for the time since it was last used, then take a
+            token. Returns False if there was no whole token to take"""
+        tokens = self.tokens + (now - self.updated) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.updated = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+
+    def resize(self, burst):
+        """ Raise the burst of the bucket without adding any tokens, so the
+            extra room is only filled at the refill rate"""
+        if burst > self.burst:
+            self.burst = burst
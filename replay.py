@@ -0,0 +1,156 @@
+"""
+Offline replay of packet traces into a RIP version 2 router.
+    Builds a Router from a config and feeds it the datagrams of a trace
+    recorded with rip_router.py --capture, running its timers on a virtual
+    clock at the recorded times. Replay runs as fast as possible to measure
+    the receive path against real traffic, or at a multiple of the recorded
+    speed. Packets the router sends are counted and discarded.
+    Usage: python3 replay.py <trace> <config> [--router-id N] [--speed <factor>] [--show-table]
+"""
+
+import argparse
+import sys
+from time import perf_counter, sleep
+from capture import read_trace
+from config_loader import load_router_config
+from rip_router import Router, TIMER_RESOLUTION
+from router_log import LEVELS, start_logging, stop_logging
+
+
+class ReplaySocket:
+    """ Stand-in for a router's send socket that counts and discards packets"""
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+
+
+    def sendto(self, data, address):
+        self.packets += 1
+        self.bytes += len(data)
+
+
+    def close(self):
+        pass
+
+
+class Replayer:
+    """
+    Replays a trace into a Router on a virtual clock.
+     - Create with a config from packets.check_config() and the records from
+       capture.read_trace()
+     - Start with Replayer.run(), which returns the real time taken
+    """
+    def __init__(self, config, records):
+        self.records = records
+        self.now = records[0][0] if records else 0.0
+        self.router = Router(*config, clock=self.clock)
+        self.router.send_socket = ReplaySocket()
+        self.router.metrics.timing = True
+
+
+    def __repr__(self):
+        """ Return a string representation of a Replayer object"""
+        return f"Replayer({len(self.records)} records, t={self.now:.3f})"
+
+
+    def clock(self):
+        """ The virtual clock given to the router"""
+        return self.now
+
+
+    def run(self, speed=None):
+        """ Feed every record to the router, as fast as possible or at the
+            recorded speed multiplied by speed"""
+        router = self.router
+        first = self.now
+        next_timer = self.now + router.process_timers()
+        start = perf_counter()
+        for timestamp, port, _, data in self.records:
+            while next_timer <= timestamp:
+                self.now = next_timer
+                next_timer = self.now + max(router.process_timers(), TIMER_RESOLUTION)
+            if speed is not None:
+                delay = (timestamp - first) / speed - (perf_counter() - start)
+                if delay > 0:
+                    sleep(delay)
+            self.now = timestamp
+            router.handle_packet(data, port)
+            event_time = router.get_event_time()
+            if event_time is not None:
+                next_timer = min(next_timer, self.now + max(event_time, TIMER_RESOLUTION))
+        return perf_counter() - start
+
+
+    def print_summary(self, elapsed):
+        """ Print the speed of the replay and what the router did"""
+        metrics = self.router.metrics
+        span = self.records[-1][0] - self.records[0][0] if self.records else 0
+        print(f"Replayed {len(self.records)} packets covering {span:.1f} seconds in {elapsed:.3f} seconds")
+        if elapsed > 0:
+            print(f"    {len(self.records) / elapsed:.0f} packets per second")
+        print(
+            f"    {metrics.decode_seconds.sum:.3f} s decoding {metrics.decode_seconds.count} packets, "
+            f"{metrics.update_seconds.sum:.3f} s updating the table"
+        )
+        print(
+            f"    {sum(metrics.packets_malformed.values())} malformed, "
+            f"{sum(metrics.packets_dropped.values())} from unknown routers, "
+            f"{sum(metrics.packets_rate_limited.values())} rate limited, "
+            f"{metrics.entries_invalid} invalid entries"
+        )
+        print(
+            f"    {metrics.routes_added} routes added, {metrics.routes_changed} changed, "
+            f"{metrics.routes_timed_out} timed out, {metrics.routes_removed} removed"
+        )
+        print(
+            f"    {metrics.periodic_updates_sent} periodic and {metrics.triggered_updates_sent} triggered updates, "
+            f"{self.router.send_socket.packets} packets sent"
+        )
+
+
+def main():
+    """ main"""
+    parser = argparse.ArgumentParser(description="Replay a packet trace into a RIP router")
+    parser.add_argument("trace", help="trace recorded with rip_router.py --capture")
+    parser.add_argument("config", help="config file of the router to replay into, or a network snapshot")
+    parser.add_argument(
+        "--router-id", type=int,
+        help="router to load from a snapshot (default: the router that recorded the trace)"
+    )
+    parser.add_argument(
+        "--speed", type=float,
+        help="replay at this multiple of the recorded speed (default: as fast as possible)"
+    )
+    parser.add_argument(
+        "--log-level", choices=LEVELS, default="error",
+        help="lowest level of router messages to show, 'debug' includes every dropped packet (default: error)"
+    )
+    parser.add_argument("--show-table", action="store_true", help="print the forwarding table after the replay")
+    args = parser.parse_args()
+    try:
+        router_id, records = read_trace(args.trace)
+        config = load_router_config(args.config, router_id if args.router_id is None else args.router_id)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if config[0] != router_id:
+        print(f"Warning: trace was recorded by router {router_id}, replaying into router {config[0]}")
+    if args.speed is not None and args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    replayer = Replayer(config, records)
+    listener = start_logging(args.log_level)
+    try:
+        elapsed = replayer.run(args.speed)
+    except KeyboardInterrupt:
+        print("Keyboard Interrupt: Stopping replay")
+        return
+    finally:
+        stop_logging(listener)
+    replayer.print_summary(elapsed)
+    if args.show_table:
+        replayer.router.print_forwarding_table()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,38 @@ Max Croucher and Tarras Weir
 """
 
 
+import argparse
+import heapq
+import logging
+import os
 import select
 import socket
 import sys
 import random
-from time import time
+from itertools import chain
+from math import isnan
+from time import perf_counter, time
 from packets import *
-
+from metrics import RouterMetrics
+from forwarding_table import NO_TIME, ForwardingTable, write_checkpoint, read_checkpoint
+from rate_limit import TokenBucket
+from async_router import run_async
+from capture import CaptureWriter
+from profiler import DEFAULT_PROFILE_DIR, Profiler
+from config_loader import load_router_config
+from router_log import LEVELS, DEFAULT_LEVEL, get_router_logger, start_logging, stop_logging
+
+LOCALHOST = "127.0.0.1"
+ENGINES = ("select", "asyncio", "uvloop")
+TIMER_RESOLUTION = 0.001 # timers due within this many seconds are run early
+TABLE_DUMP_INTERVAL = 1.0 # minimum time in seconds between logged table dumps
+BATCH_LIMIT = 64 # most datagrams read from one socket per wakeup
+RATE_LIMIT = 500 # packets per second accepted from one neighbour on one port
+RATE_BURST = 1000 # least packets accepted at once, enough for a full table of 25000 routes
+BURST_TABLES = 2 # full advertisements of the forwarding table's size a neighbour may send at once
+MAX_RATE_BURST = 10000 # most packets accepted at once however large the table grows, unless rate_burst is larger
+CHECKPOINT_INTERVAL = 10.0 # seconds between checkpoints of the forwarding table
+PROVISIONAL_PERIODS = 2 # periodic updates a restored route is kept for without being confirmed
 
 class Router:
     """
@@ -21,18 +46,50 @@ class Router:
      - Start with Router.run()
      - Stop with Router.close()
     """
-    def __init__(self, router_id, input_ports, outputs, timers):
-        """ Initialise a Router using parameters from a config file"""
+    def __init__(self, router_id, input_ports, outputs, timers, clock=time):
+        """ Initialise a Router using parameters from a config file. clock may be
+            replaced by any function returning the current time in seconds"""
+        self.clock = clock
         self.router_id = router_id
         self.input_ports = input_ports
         self.outputs = outputs
+        self.neighbours = {neighbour.router_id: neighbour for neighbour in outputs}
         self.periodic_timeout = timers[0]
         self.max_downtime = timers[1]
         self.garbage_time = timers[2]
         self.trigger_timer = timers[3]
 
-        self.forwarding_table = {}
+        self.forwarding_table = ForwardingTable()
+        self.changed_routes = set() # destinations changed since the last update
+        self.dirty_routes = set() # destinations changed since adverts were cached
+        self.advert_entries = {neighbour.router_id: {} for neighbour in outputs}
+        self.advert_packets = {neighbour.router_id: None for neighbour in outputs}
+        self.expiry_heap = [] # (deadline, destination) pairs, invalidated lazily
+        self.route_deadlines = {} # the live heap deadline of each destination
         self.sockets = []
+        self.socket_ports = {} # input port of each socket in self.sockets
+        self.send_socket = None
+        self.batch_limit = BATCH_LIMIT
+        self.rate_limit = RATE_LIMIT # None to accept packets at any rate
+        self.rate_burst = RATE_BURST
+        self.buckets = {} # TokenBucket of each (sender id, port)
+        self.data_plane = False # forward data packets
+        self.next_hop_ports = {} # output port of the next hop to each destination
+        self.metrics = RouterMetrics(router_id)
+        self.metrics_port = None # answer metrics queries on this port if set
+        self.metrics_socket = None
+        self.capture = None # CaptureWriter recording received datagrams if set
+        self.checkpoint_file = None # checkpoint the forwarding table to this file if set
+        self.checkpoint_interval = CHECKPOINT_INTERVAL
+        self.next_checkpoint = 0
+        self.provisional_routes = {} # time last heard of restored routes not yet confirmed by a neighbour
+        self.table_loaded = False # the table was restored or built by a running router, so may be checkpointed
+        self.profiler = None # Profiler controlled through the metrics socket if set
+
+        self.logger = get_router_logger(router_id)
+        self.table_dump_interval = TABLE_DUMP_INTERVAL
+        self.table_dump_pending = False
+        self.next_table_dump = 0
 
         self.reset_periodic_timer()
         self.reset_triggered_timer()
@@ -59,17 +116,23 @@ class Router:
 
 
     def get_neighbour_cost(self, neighbour_id):
-        """ Look through list of directly attached neighbours and find the cost
-            of a given neighbour"""
-        for neighbour in self.outputs:
-            if neighbour.router_id == neighbour_id:
-                return neighbour.metric
-        raise Exception("Recieved packet from unconfigured router")
+        """ Find the cost of a given directly attached neighbour"""
+        neighbour = self.neighbours.get(neighbour_id)
+        if neighbour is None:
+            raise Exception("Recieved packet from unconfigured router")
+        return neighbour.metric
+
+
+    def time_until(self, deadline):
+        """ Get the time in seconds until a deadline, treating any deadline
+            within TIMER_RESOLUTION as already due"""
+        remaining = deadline - self.clock()
+        return remaining if remaining > TIMER_RESOLUTION else 0
 
 
     def get_update_time(self):
         """ Get the time in seconds until the router needs to update all neighbours"""
-        return max(self.last_update - time() + self.current_timeout, 0)
+        return self.time_until(self.last_update + self.current_timeout)
 
 
     def reset_periodic_timer(self):
@@ -77,22 +140,23 @@ class Router:
         self.current_timeout = self.periodic_timeout[0] + round(
             random.uniform(-self.periodic_timeout[1], self.periodic_timeout[1]), 2
         )
-        self.last_update = time()
+        self.last_update = self.clock()
 
 
     def get_trigger_time(self):
         """ Get the time in seconds until the router may send triggered messages"""
-        return max(self.last_trigger - time() + self.trigger_timeout, 0)
+        return self.time_until(self.last_trigger + self.trigger_timeout)
 
 
     def reset_triggered_timer(self):
         """ Reset the timer that prevents flooding of lots of updated packets"""
         self.trigger_timeout = round(random.uniform(self.trigger_timer[0], self.trigger_timer[1]))
-        self.last_trigger = time()
+        self.last_trigger = self.clock()
 
 
     def open(self):
-        """ Open sockets at each input_port"""
+        """ Open sockets at each input_port, a single socket for sending updates
+            to every neighbour, and a metrics socket if metrics_port is set"""
         for port in self.input_ports:
             server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # Initialise UDP socket
             server.setblocking(0)
@@ -101,179 +165,724 @@ class Router:
             except OSError as e:
                 raise Exception(f'Cannot open {port}. {e}')
             self.sockets.append(server)
+            self.socket_ports[server] = port
+        self.send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.send_socket.setblocking(0)
+        if self.metrics_port is not None:
+            self.metrics_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.metrics_socket.setblocking(0)
+            try:
+                self.metrics_socket.bind((LOCALHOST, self.metrics_port))
+            except OSError as e:
+                raise Exception(f'Cannot open metrics port {self.metrics_port}. {e}')
+            self.metrics.timing = True
+        self.table_loaded = True
 
 
     def close(self):
-        """ Close all sockets"""
+        """ Close all sockets and the capture, and write a final checkpoint if
+            checkpointing a table that was restored or built. Closing again
+            writes no further checkpoint"""
         for s in self.sockets:
             s.close()
+        self.sockets = []
+        self.socket_ports = {}
+        if self.send_socket is not None:
+            self.send_socket.close()
+            self.send_socket = None
+        if self.metrics_socket is not None:
+            self.metrics_socket.close()
+            self.metrics_socket = None
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        if self.checkpoint_file is not None and self.table_loaded:
+            self.checkpoint_table()
+            self.table_loaded = False
+
+
+    def format_forwarding_table(self):
+        """ Format contents of the forwarding table in a readable manner"""
+        if not self.forwarding_table:
+            return "Forwarding Table is empty"
+        lines = [
+            "Forwarding Table:",
+            "    destination, next_hop, metric, last-updated, garbage-timer",
+        ]
+        for destination_id, entry in self.forwarding_table.items():
+            timeout = '-' if entry.timeout is None else f"{entry.timeout:.1f}"
+            garbage = '-' if entry.garbage is None else f"{entry.garbage:.1f}"
+            provisional = "  provisional" if destination_id in self.provisional_routes else ""
+            lines.append(
+                f"    {destination_id:<11} "
+                f" {entry.router_id:<8} "
+                f" {entry.metric:<6} "
+                f" {timeout:<12} "
+                f" {garbage}{provisional}"
+            )
+        return "\n".join(lines) + "\n"
 
 
     def print_forwarding_table(self):
         """ Print contents of the forwarding table in a readable manner"""
-        if not self.forwarding_table:
-            print("Forwarding Table is empty")
-        else:
-            print("Forwarding Table:")
-            print("    destination, next_hop, metric, last-updated, garbage-timer")
-            for destination_id, entry in self.forwarding_table.items():
-                timeout = '-' if entry.timeout is None else f"{entry.timeout:.1f}"
-                garbage = '-' if entry.garbage is None else f"{entry.garbage:.1f}"
-                print(
-                    f"    {destination_id:<11}",
-                    f" {entry.router_id:<8}",
-                    f" {entry.metric:<6}",
-                    f" {timeout:<12}",
-                    f" {garbage}"
-                )
-            print()
+        print(self.format_forwarding_table())
+
+
+    def request_table_dump(self):
+        """ Ask for the forwarding table to be logged at debug level. Dumps are
+            coalesced to at most one every table_dump_interval seconds"""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.table_dump_pending = True
+
+
+    def log_forwarding_table(self):
+        """ Log the forwarding table if a dump is pending and due"""
+        if self.table_dump_pending and self.time_until(self.next_table_dump) == 0:
+            self.logger.debug(self.format_forwarding_table())
+            self.table_dump_pending = False
+            self.next_table_dump = self.clock() + self.table_dump_interval
+
+
+    def mark_changed(self, destination_id):
+        """ Record that the route to a destination has changed, so that it is
+            carried by the next triggered update and re-encoded for each
+            neighbour"""
+        self.changed_routes.add(destination_id)
+        self.dirty_routes.add(destination_id)
+        self.next_hop_ports.pop(destination_id, None)
+
+
+    def invalidate_adverts(self):
+        """ Re-encode every route for every neighbour before the next update.
+            Needed after the forwarding table is changed other than through
+            mark_changed()"""
+        self.dirty_routes.update(self.forwarding_table)
+
+
+    def refresh_adverts(self):
+        """ Re-encode the cached advertisement entries of changed routes for
+            each neighbour, and drop the cached packets of any neighbour whose
+            entries changed"""
+        if not self.dirty_routes:
+            return
+        for neighbour in self.outputs:
+            entries = self.advert_entries[neighbour.router_id]
+            for destination in self.dirty_routes:
+                table_entry = self.forwarding_table.get(destination)
+                if table_entry is None or table_entry.timeout is None:
+                    entries.pop(destination, None) # don't send removed or timed out routes
+                elif table_entry.router_id == neighbour.router_id: # poisoned reverse
+                    entries[destination] = generate_entry(2, destination, INF_METRIC)
+                else:
+                    entries[destination] = generate_entry(2, destination, table_entry.metric)
+            self.advert_packets[neighbour.router_id] = None
+        self.dirty_routes = set()
+
+
+    def advert_packets_for(self, neighbour, destinations=None):
+        """ Get the packets advertising the forwarding table to a neighbour from
+            the cached entries. Full tables are cached as packets until a route
+            changes"""
+        entries = self.advert_entries[neighbour.router_id]
+        if destinations is not None:
+            return generate_packets(2, 2, self.router_id, (
+                entries[destination] for destination in destinations if destination in entries
+            ))
+        packets = self.advert_packets[neighbour.router_id]
+        if packets is None:
+            self_entry = generate_entry(2, self.router_id, 0) # advertise self
+            body = b"".join(chain((self_entry,), entries.values()))
+            packets = split_packets(2, 2, self.router_id, body)
+            self.advert_packets[neighbour.router_id] = packets
+        return packets
+
+
+    def route_deadline(self, entry):
+        """ Get the time at which a route times out, or is garbage collected if
+            it has already timed out"""
+        if entry.garbage is not None:
+            return entry.garbage + self.garbage_time
+        if entry.timeout is not None:
+            return entry.timeout + self.max_downtime
+        return None
+
+
+    def schedule_expiry(self, destination_id):
+        """ Make sure the expiry heap holds a deadline no later than the current
+            deadline of a route. Later deadlines are rescheduled lazily when an
+            earlier one is popped"""
+        deadline = self.route_deadline(self.forwarding_table[destination_id])
+        scheduled = self.route_deadlines.get(destination_id)
+        if deadline is not None and (scheduled is None or deadline < scheduled):
+            self.route_deadlines[destination_id] = deadline
+            heapq.heappush(self.expiry_heap, (deadline, destination_id))
+
+
+    def get_expiry_time(self):
+        """ Get the time in seconds until the next route deadline, or None if no
+            routes are waiting to expire"""
+        if not self.expiry_heap:
+            return None
+        return self.time_until(self.expiry_heap[0][0])
+
+
+    def get_event_time(self):
+        """ Get the time in seconds until a triggered update, route expiry,
+            table dump or checkpoint is due, or None if none are waiting"""
+        delays = []
+        if self.schedule_update:
+            delays.append(self.get_trigger_time())
+        if self.table_dump_pending:
+            delays.append(self.time_until(self.next_table_dump))
+        if self.checkpoint_file is not None:
+            delays.append(self.time_until(self.next_checkpoint))
+        expiry_time = self.get_expiry_time()
+        if expiry_time is not None:
+            delays.append(expiry_time)
+        return min(delays, default=None)
 
 
     def check_router_down(self):
-        """ Check forwarding table to see if any routers should be marked as down"""
+        """ Time out or remove every route whose deadline has passed"""
         has_updated = False
-        routes_to_remove = []
-        for destination_id, entry in self.forwarding_table.items():
-            if entry.garbage is not None and entry.garbage + self.garbage_time < time():
+        now = self.clock()
+        due = now + TIMER_RESOLUTION
+        while self.expiry_heap and self.expiry_heap[0][0] <= due:
+            deadline, destination_id = heapq.heappop(self.expiry_heap)
+            if self.route_deadlines.get(destination_id) != deadline:
+                continue # superseded by an earlier deadline for the same route
+            entry = self.forwarding_table[destination_id]
+            current_deadline = self.route_deadline(entry)
+            if current_deadline is None:
+                self.route_deadlines.pop(destination_id)
+            elif current_deadline > due:
+                # Route was refreshed since this deadline was scheduled
+                self.route_deadlines[destination_id] = current_deadline
+                heapq.heappush(self.expiry_heap, (current_deadline, destination_id))
+            elif entry.garbage is not None:
                 # Remove entry from table entirely
-                routes_to_remove.append(destination_id)
-                print(f"{destination_id} is to be removed from the table")
+                self.forwarding_table.pop(destination_id)
+                self.route_deadlines.pop(destination_id)
+                self.logger.info(f"{destination_id} is to be removed from the table")
+                self.metrics.routes_removed += 1
+                self.mark_changed(destination_id)
                 has_updated = True
-            elif entry.timeout is not None and entry.timeout + self.max_downtime < time():
+            else:
                 # Mark destination as unreachable
-                self.forwarding_table[destination_id].metric = INF_METRIC
-                self.forwarding_table[destination_id].garbage = time()
-                self.forwarding_table[destination_id].timeout = None
+                entry.metric = INF_METRIC
+                entry.garbage = now
+                entry.timeout = None
+                self.route_deadlines.pop(destination_id)
+                self.provisional_routes.pop(destination_id, None)
+                self.schedule_expiry(destination_id)
+                self.mark_changed(destination_id)
                 has_updated = True
-                print(f"{destination_id} is unreachable")
-
-
-        for route in routes_to_remove:
-            self.forwarding_table.pop(route)
+                self.logger.info(f"{destination_id} is unreachable")
+                self.metrics.routes_timed_out += 1
 
         if has_updated:
-            self.print_forwarding_table()
+            self.request_table_dump()
+
+
+    def checkpoint_table(self):
+        """ Write the live routes to checkpoint_file, replacing the previous
+            checkpoint"""
+        try:
+            write_checkpoint(
+                self.checkpoint_file, self.router_id, self.forwarding_table, self.clock(), self.provisional_routes
+            )
+            self.metrics.table_checkpoints += 1
+        except OSError as e:
+            self.logger.warning(f"Could not checkpoint the forwarding table. {e}")
+        self.next_checkpoint = self.clock() + self.checkpoint_interval
+
+
+    def restore_checkpoint(self):
+        """ Load the routes in checkpoint_file, if there is one, as provisional
+            routes. A restored route keeps what was left of its timeout when
+            it was last heard, counting the time the router was down, but is
+            kept for at least PROVISIONAL_PERIODS periodic updates so that its
+            next hop has a chance to confirm it. A route that was already
+            provisional when it was saved gets no more time, so restarting
+            again and again never keeps an unconfirmed route alive. Returns the
+            number of routes restored"""
+        if not os.path.exists(self.checkpoint_file):
+            self.logger.info(f"No checkpoint at {self.checkpoint_file}, starting with an empty table")
+            return 0
+        router_id, saved_at, routes = read_checkpoint(self.checkpoint_file)
+        if router_id != self.router_id:
+            raise Exception(f"{self.checkpoint_file} is a checkpoint of router {router_id}")
+        now = self.clock()
+        grace = min(PROVISIONAL_PERIODS * sum(self.periodic_timeout), self.max_downtime)
+        restored = 0
+        for destination_id, next_hop, metric, heard_at, timeout, provisional in routes:
+            if (
+                destination_id == self.router_id or destination_id in self.forwarding_table or
+                next_hop not in self.neighbours or metric >= INF_METRIC
+                ):
+                continue # the config has changed since the checkpoint
+            if not provisional:
+                timeout = now - self.max_downtime + max(self.max_downtime - (now - heard_at), grace)
+            elif timeout + self.max_downtime <= now:
+                continue # an unconfirmed route whose time has run out
+            self.forwarding_table.add(destination_id, next_hop, metric, timeout, None)
+            self.provisional_routes[destination_id] = heard_at
+            self.schedule_expiry(destination_id)
+            self.mark_changed(destination_id)
+            restored += 1
+        self.metrics.routes_restored += restored
+        self.table_loaded = True
+        self.logger.info(
+            f"Restored {restored} of {len(routes)} routes from a checkpoint saved "
+            f"{now - saved_at:.1f} seconds ago"
+        )
+        self.request_table_dump()
+        return restored
 
 
-    def update_forwarding_table(self, sender_id, entries):
-        """ Update forwarding table using an incoming packet"""
+    def apply_entries(self, sender_id, entries, now):
+        """ Apply the entries of one packet to the forwarding table, without
+            logging or scheduling an update. Returns whether any route changed.
+            Routes are read and written through the table's arrays by slot,
+            rather than through Route views, as this runs for every entry"""
         has_updated = False
+        neighbour_cost = self.get_neighbour_cost(sender_id)
+        table = self.forwarding_table
+        slots = table.slots
+        next_hops = table.next_hops
+        route_metrics = table.metrics
+        timeouts = table.timeouts
+        garbages = table.garbages
+        provisional = self.provisional_routes
         for entry in entries:
-            _, destination_id, metric = entry
+            family_id, destination_id, metric = entry
+            if family_id != ADDRESS_FAMILY or metric > INF_METRIC:
+                self.metrics.entries_invalid += 1
+                continue
             if destination_id != self.router_id: #Ignore routes to self
-                cost = min(self.get_neighbour_cost(sender_id) + metric, INF_METRIC)
-                if (
-                    destination_id not in self.forwarding_table or
-                    self.forwarding_table[destination_id].garbage is not None
-                    ):
+                cost = min(neighbour_cost + metric, INF_METRIC)
+                slot = slots.get(destination_id)
+                if slot is None or not isnan(garbages[slot]):
                     # Add an unknown or marked-for-garbage route
                     if cost < INF_METRIC:
                         #Don't bother adding a route with an infinite cost
-                        new_entry = RoutingEntry(sender_id, None, cost, time(), None)
-                        self.forwarding_table[destination_id] = new_entry
+                        table.add(destination_id, sender_id, cost, now, None)
+                        self.schedule_expiry(destination_id)
+                        self.mark_changed(destination_id)
+                        self.metrics.routes_added += 1
                         has_updated = True
                 else:
-                    route = self.forwarding_table[destination_id]
-                    if route.router_id == sender_id:
-                        # Reset timeout or re-enable a route if the route is
-                        # confirmed alive by the next_hop
-                        route.timeout = time()
-                        if route.garbage is not None:
-                            route.metric = cost
-                            route.garbage = None
+                    # Routes marked for garbage were handled above, so this
+                    # route is live
+                    next_hop = next_hops[slot]
+                    route_metric = route_metrics[slot]
+                    if destination_id in provisional and (next_hop == sender_id or route_metric > cost):
+                        # A restored route is heard from its next hop, or replaced
+                        del provisional[destination_id]
+                        self.metrics.routes_confirmed += 1
+                    if next_hop == sender_id:
+                        # Reset timeout if the route is confirmed alive by the next_hop
+                        timeouts[slot] = now
                     if (
-                        (route.router_id == sender_id and route.metric != cost) or
-                        (route.router_id != sender_id and route.metric > cost)
+                        (next_hop == sender_id and route_metric != cost) or
+                        (next_hop != sender_id and route_metric > cost)
                         ):
                         # Update forwarding table if needed
-                        route.metric = cost
-                        route.router_id = sender_id
+                        route_metrics[slot] = cost
+                        next_hops[slot] = sender_id
+                        self.mark_changed(destination_id)
+                        self.metrics.routes_changed += 1
                         has_updated = True
-                        if cost == INF_METRIC and route.timeout is not None:
-                            route.timeout = None
-                            route.garbage = time()
+                        if cost == INF_METRIC and not isnan(timeouts[slot]):
+                            timeouts[slot] = NO_TIME
+                            garbages[slot] = now
                         else:
-                            route.timeout = time()
+                            timeouts[slot] = now
+        return has_updated
+
+
+    def routes_updated(self, senders):
+        """ Log a change to the forwarding table made by packets from a list of
+            routers, and schedule a triggered update"""
+        if len(senders) == 1:
+            self.logger.info(f"Updated forwarding table with a packet from Router {senders[0]}")
+        else:
+            routers = ", ".join(str(sender_id) for sender_id in sorted(set(senders)))
+            self.logger.info(f"Updated forwarding table with {len(senders)} packets from Routers {routers}")
+        self.request_table_dump()
+        burst = self.get_rate_burst()
+        for bucket in self.buckets.values():
+            bucket.resize(burst)
+        if self.schedule_update:
+            # Folded into the triggered update that is already waiting
+            self.metrics.triggered_updates_suppressed += 1
+        self.schedule_update = True
+
+
+    def update_forwarding_table(self, sender_id, entries):
+        """ Update forwarding table using an incoming packet"""
+        if self.apply_entries(sender_id, entries, self.clock()):
+            self.routes_updated([sender_id])
 
-            if has_updated:
-                #Print new table and schedule a triggered update
-                print(f"Updated forwarding table with a packet from Router {sender_id}")
-                self.print_forwarding_table()
-                self.schedule_update = True
 
+    def update_forwarding_table_batch(self, packets):
+        """ Update the forwarding table using a list of (sender_id, entries)
+            packets, with a single log message and triggered update for all of
+            them"""
+        now = self.clock()
+        senders = [sender_id for sender_id, entries in packets if self.apply_entries(sender_id, entries, now)]
+        if senders:
+            self.routes_updated(senders)
 
-    def send_forwarding_table(self):
-        """ Send contents of forwarding table to connected routers"""
+
+    def send_forwarding_table(self, destinations=None):
+        """ Send contents of forwarding table to connected routers. A triggered
+            update passes the changed destinations to only send those routes"""
+        self.refresh_adverts()
         for neighbour in self.outputs:
-            entries_to_send = [generate_entry(2, self.router_id, 0)] # advertise self
-            for destination, table_entry in self.forwarding_table.items():
-                if table_entry.router_id == neighbour.router_id: # poisoned reverse
-                    metric = INF_METRIC
-                else:
-                    metric = table_entry.metric
-                if table_entry.timeout is not None: # don't send information about timed out routes
-                    entries_to_send.append(generate_entry(2, destination, metric))
+            address = (LOCALHOST, neighbour.port)
+            for rip_packet in self.advert_packets_for(neighbour, destinations):
+                try:
+                    self.send_socket.sendto(rip_packet, address)
+                except OSError:
+                    pass # a lost update is recovered by the next periodic update
+        self.changed_routes = set()
+
+
+    def get_rate_burst(self):
+        """ Get the packets accepted at once from a neighbour on one port: at
+            least rate_burst, and enough for BURST_TABLES periodic updates the
+            size of the forwarding table up to MAX_RATE_BURST. Neighbours can
+            grow the table, so the cap keeps them from raising their own burst
+            without bound"""
+        table_packets = BURST_TABLES * (len(self.forwarding_table) // MAX_ENTRIES + 1)
+        return max(self.rate_burst, min(table_packets, MAX_RATE_BURST))
+
+
+    def admit_datagram(self, data, port=None):
+        """ Cheaply check a datagram recieved on an input port before any of
+            its entries are decoded. Returns the sender id, or None if the
+            datagram was dropped for its length, header or sender, or because
+            its sender has gone over the rate limit on this port"""
+        metrics = self.metrics
+        metrics.packets_received[port] += 1
+        length = len(data)
+        if length < HEADER.size or length > MAX_PACKET_SIZE or (length - HEADER.size) % ENTRY.size:
+            metrics.packets_malformed[port] += 1
+            self.logger.debug("Recieved packet of %s bytes on port %s. Dropped", length, port)
+            return None
+        command, version, sender_id = decode_header(data)
+        if command != RESPONSE_COMMAND or version != RIP_VERSION:
+            metrics.packets_malformed[port] += 1
+            self.logger.debug("Recieved packet with command %s and version %s on port %s. Dropped", command, version, port)
+            return None
+        if sender_id not in self.neighbours:
+            metrics.packets_dropped[port] += 1
+            self.logger.debug("Recieved packet from unconfigured router %s on port %s. Dropped", sender_id, port)
+            return None
+        if self.rate_limit is not None:
+            now = self.clock()
+            bucket = self.buckets.get((sender_id, port))
+            if bucket is None:
+                bucket = self.buckets[sender_id, port] = TokenBucket(self.rate_limit, self.get_rate_burst(), now)
+            if not bucket.take(now):
+                metrics.packets_rate_limited[port] += 1
+                self.logger.debug("Router %s is over the rate limit on port %s. Dropped", sender_id, port)
+                return None
+        return sender_id
+
+
+    def decode_datagram(self, data, port=None):
+        """ Validate and decode a datagram recieved on an input port. Returns
+            the sender id and entries, or None if the datagram was dropped"""
+        if self.data_plane and data[:1] == DATA_COMMAND_BYTE:
+            self.forward_data(data, port)
+            return None
+        sender_id = self.admit_datagram(data, port)
+        if sender_id is None:
+            return None
+        metrics = self.metrics
+        if metrics.timing:
+            start = perf_counter()
+        entries = decode_entries(data)
+        if metrics.timing:
+            metrics.decode_seconds.observe(perf_counter() - start)
+        return sender_id, entries
+
+
+    def next_hop_port(self, destination_id):
+        """ Get the output port of the next hop to a destination, or None if
+            the destination is unreachable. Ports are cached until the route to
+            the destination changes"""
+        port = self.next_hop_ports.get(destination_id)
+        if port is None:
+            route = self.forwarding_table.get(destination_id)
+            if route is None or route.metric >= INF_METRIC:
+                return None
+            port = self.next_hop_ports[destination_id] = self.neighbours[route.router_id].port
+        return port
+
+
+    def forward_data(self, data, port=None):
+        """ Deliver a data packet addressed to this router, or send it on to the
+            next hop towards its destination. Echo requests are answered, and
+            packets that run out of hops or have no route are reported, to the
+            reply port of the packet"""
+        metrics = self.metrics
+        metrics.packets_received[port] += 1
+        try:
+            _, _, _, destination, ttl, kind, reply_port, sequence, sent_time = decode_data(data)
+        except Exception:
+            metrics.packets_malformed[port] += 1
+            return
+        if destination == self.router_id:
+            metrics.data_delivered += 1
+            if kind == ECHO_REQUEST:
+                self.send_data_reply(ECHO_REPLY, reply_port, sequence, sent_time)
+            return
+        if ttl <= 1:
+            metrics.data_expired += 1
+            if kind == ECHO_REQUEST:
+                self.send_data_reply(TTL_EXCEEDED, reply_port, sequence, sent_time)
+            return
+        next_port = self.next_hop_port(destination)
+        if next_port is None:
+            metrics.data_unreachable += 1
+            if kind == ECHO_REQUEST:
+                self.send_data_reply(UNREACHABLE, reply_port, sequence, sent_time)
+            return
+        packet = bytearray(data)
+        HEADER.pack_into(packet, 0, DATA_COMMAND, RIP_VERSION, self.router_id)
+        packet[DATA_TTL_OFFSET] = ttl - 1
+        try:
+            self.send_socket.sendto(packet, (LOCALHOST, next_port))
+            metrics.data_forwarded += 1
+        except OSError:
+            metrics.data_unreachable += 1
+
+
+    def send_data_reply(self, kind, reply_port, sequence, sent_time):
+        """ Answer a data packet on its reply port on localhost"""
+        try:
+            self.send_socket.sendto(
+                pack_data(self.router_id, 0, 0, kind, reply_port, sequence, sent_time),
+                (LOCALHOST, reply_port)
+            )
+        except OSError:
+            pass # the reply is lost like any other datagram
+
+
+    def handle_packet(self, data, port=None):
+        """ Validate a datagram recieved on an input port and update the
+            forwarding table with it"""
+        packet = self.decode_datagram(data, port)
+        if packet is None:
+            return
+        if self.metrics.timing:
+            start = perf_counter()
+            self.update_forwarding_table(*packet)
+            self.metrics.update_seconds.observe(perf_counter() - start)
+        else:
+            self.update_forwarding_table(*packet)
+
+
+    def handle_packets(self, datagrams):
+        """ Validate a batch of (data, port) datagrams and apply them to the
+            forwarding table together, with a single round of change detection"""
+        packets = []
+        for data, port in datagrams:
+            packet = self.decode_datagram(data, port)
+            if packet is not None:
+                packets.append(packet)
+        self.metrics.receive_batches += 1
+        if self.metrics.timing:
+            start = perf_counter()
+            self.update_forwarding_table_batch(packets)
+            self.metrics.update_seconds.observe(perf_counter() - start)
+        else:
+            self.update_forwarding_table_batch(packets)
+
 
-            rip_packet = generate_packet(2, 2, self.router_id, entries_to_send)
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # Initialise UDP socket
-            sock.setblocking(False)
-            sock.connect(("127.0.0.1", neighbour.port)) # attempt to connect to server
-            sock.sendall(rip_packet)
+    def receive_batch(self, server, batch):
+        """ Append the (data, port) datagrams waiting on an input socket to a
+            batch, reading until the socket would block or batch_limit
+            datagrams have been read. Each datagram is also recorded if a
+            capture is running"""
+        port = self.socket_ports[server]
+        for _ in range(self.batch_limit):
+            try:
+                data, address = server.recvfrom(BUF_SIZE)
+            except BlockingIOError:
+                break
+            if self.capture is not None:
+                self.capture.record(self.clock(), port, address, data)
+            batch.append((data, port))
+
+
+    def answer_metrics_query(self):
+        """ Reply to a query waiting on the metrics socket. The query names the
+            format of the reply, either 'json' or 'prometheus', or is a
+            'profile <command>' for the router's profiler"""
+        try:
+            query, address = self.metrics_socket.recvfrom(BUF_SIZE)
+            query = query.decode(errors="replace")
+            if query.startswith("profile"):
+                reply = self.profile_command(query[len("profile"):].strip())
+            else:
+                reply = self.metrics.render(query)
+            self.metrics_socket.sendto(reply.encode(), address)
+        except OSError as e:
+            self.logger.warning(f"Could not answer metrics query. {e}")
+
+
+    def profile_command(self, command):
+        """ Run a command for the router's profiler. Returns a message
+            describing what was done"""
+        if self.profiler is None:
+            return "Profiling is not enabled for this router"
+        try:
+            message = self.profiler.command(command)
+        except OSError as e:
+            message = f"Profiler failed. {e}"
+        self.logger.info(message)
+        return message
+
+
+    def process_timers(self):
+        """ Expire routes and send any periodic or triggered update that is due.
+            Returns the time in seconds until this should be called again"""
+        if self.get_expiry_time() == 0:
+            # Time out or remove expired routes
+            self.check_router_down()
+
+        if self.get_update_time() == 0:
+            # Send periodic update
+            self.metrics.periodic_lateness_seconds.observe(self.clock() - self.last_update - self.current_timeout)
+            self.check_router_down()
+            self.send_forwarding_table()
+            self.reset_periodic_timer()
+            self.schedule_update = False # the full table carries every changed route
+            self.metrics.periodic_updates_sent += 1
+
+        if self.schedule_update and self.get_trigger_time() == 0:
+            # Send triggered update if timeout is valid
+            self.check_router_down()
+            self.send_forwarding_table(self.changed_routes)
+            self.reset_triggered_timer()
+            self.schedule_update = False
+            self.metrics.triggered_updates_sent += 1
+
+        self.log_forwarding_table()
+
+        if self.checkpoint_file is not None and self.time_until(self.next_checkpoint) == 0:
+            self.checkpoint_table()
+
+        # Wait until it is time to send a triggered or periodic update, or until
+        # the next route expires.
+        event_time = self.get_event_time()
+        if event_time is None:
+            return self.get_update_time()
+        return min(self.get_update_time(), event_time)
 
 
     def run(self):
         """ Server Loop"""
+        readers = list(self.sockets)
+        if self.metrics_socket is not None:
+            readers.append(self.metrics_socket)
         while True:
-            if self.get_update_time() == 0:
-                # Send periodic update
-                self.check_router_down()
-                self.send_forwarding_table()
-                self.reset_periodic_timer()
-
-            if self.schedule_update and self.get_trigger_time() == 0:
-                # Send triggered update if timeout is valid
-                self.check_router_down()
-                self.send_forwarding_table()
-                self.reset_triggered_timer()
-                self.schedule_update = False
-
-            # Get socket timeout such that it ends whenever its time to send a triggered
-            # or periodic update.
-            if self.schedule_update:
-                socket_timer = min(self.get_update_time(), self.get_trigger_time())
+            timeout = self.process_timers()
+            if self.metrics.timing:
+                start = perf_counter()
+                in_packets, _, _ = select.select(readers, [], [], timeout)
+                self.metrics.select_seconds.observe(perf_counter() - start)
             else:
-                socket_timer = self.get_update_time()
-
-            in_packets, _, _ = select.select(self.sockets, [], [], socket_timer)
-            if in_packets != []:
-                for server in in_packets:
-                    for s in self.sockets:
-                        if server is s: # read packet from correct port
-                            data, _ = server.recvfrom(BUF_SIZE)
-                            try:
-                                _, _, sender_id, entries = decode_packet(data)
-                                self.update_forwarding_table(sender_id, entries)
-                            except:
-                                print(f"Recieved malformed packet from {sender_id}. Dropped")
+                in_packets, _, _ = select.select(readers, [], [], timeout)
+            batch = []
+            for server in in_packets:
+                if server is self.metrics_socket:
+                    self.answer_metrics_query()
+                else:
+                    self.receive_batch(server, batch)
+            if batch:
+                self.handle_packets(batch)
 
 
 def main():
     """ main"""
-    if len(sys.argv) == 2:
-        filename = sys.argv[1]
-    else:
-        print("Error: Incorrect number of parameters.")
-        print("Usage: python3 {path.basename(__file__)} <config-filename>")
-        sys.exit()
+    parser = argparse.ArgumentParser(description="RIP version 2 router")
+    parser.add_argument("config", help="config file for this router, or a network snapshot")
+    parser.add_argument("--router-id", type=int, help="router to run from a snapshot")
+    parser.add_argument(
+        "--engine", choices=ENGINES, default="select",
+        help="event loop used to run the router (default: select)"
+    )
+    parser.add_argument(
+        "--log-level", choices=LEVELS, default=DEFAULT_LEVEL,
+        help=f"lowest level of messages to log, 'debug' includes table dumps (default: {DEFAULT_LEVEL})"
+    )
+    parser.add_argument("--log-file", help="write log messages to a file instead of stdout")
+    parser.add_argument("--metrics-port", type=int, help="answer metrics queries on this local UDP port")
+    parser.add_argument(
+        "--table-interval", type=float, default=TABLE_DUMP_INTERVAL,
+        help=f"minimum seconds between logged table dumps (default: {TABLE_DUMP_INTERVAL})"
+    )
+    parser.add_argument(
+        "--batch-limit", type=int, default=BATCH_LIMIT,
+        help=f"most packets read from one input port per wakeup, all of which are applied together (default: {BATCH_LIMIT})"
+    )
+    parser.add_argument(
+        "--rate-limit", type=float, default=RATE_LIMIT,
+        help=f"packets per second accepted from each neighbour on each port, 0 for no limit (default: {RATE_LIMIT})"
+    )
+    parser.add_argument(
+        "--rate-burst", type=int, default=RATE_BURST,
+        help=f"least packets accepted at once from each neighbour on each port, raised for large tables up to {MAX_RATE_BURST} (default: {RATE_BURST})"
+    )
+    parser.add_argument("--data-plane", action="store_true", help="forward data packets using the forwarding table")
+    parser.add_argument("--capture", metavar="FILE", help="record every received datagram to a trace file for replay.py")
+    parser.add_argument(
+        "--checkpoint", metavar="FILE",
+        help="save the forwarding table to this file periodically and on exit, and restore it at startup"
+    )
+    parser.add_argument(
+        "--checkpoint-interval", type=float, default=CHECKPOINT_INTERVAL,
+        help=f"seconds between checkpoints of the forwarding table (default: {CHECKPOINT_INTERVAL})"
+    )
+    parser.add_argument(
+        "--profile-dir", default=DEFAULT_PROFILE_DIR,
+        help=f"directory for results of profiling started by SIGUSR1 or a metrics query (default: {DEFAULT_PROFILE_DIR})"
+    )
+    args = parser.parse_args()
     try:
-        router = Router(*check_config(parse_config(filename)))
+        router = Router(*load_router_config(args.config, args.router_id))
+        if args.capture is not None:
+            router.capture = CaptureWriter(args.capture, router.router_id)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit()
+    router.batch_limit = max(args.batch_limit, 1)
+    router.rate_limit = args.rate_limit if args.rate_limit > 0 else None
+    router.rate_burst = args.rate_burst
+    router.data_plane = args.data_plane
+    router.table_dump_interval = args.table_interval
+    router.metrics_port = args.metrics_port
+    router.checkpoint_file = args.checkpoint
+    router.checkpoint_interval = args.checkpoint_interval
+    Profiler([router], args.profile_dir, f"router-{router.router_id}").install_signals()
+    listener = start_logging(args.log_level, args.log_file)
     try:
+        if router.checkpoint_file is not None:
+            try:
+                router.restore_checkpoint()
+            except Exception as e:
+                router.logger.warning(f"Could not restore the forwarding table, starting with an empty table. {e}")
         router.pretty_print()
-        router.open()
-        router.run()
+        if args.engine == "select":
+            router.open()
+            router.run()
+        else:
+            run_async([router], use_uvloop=args.engine == "uvloop")
     except KeyboardInterrupt:
         print("Keyboard Interrupt: Stopping Server")
         router.close()
@@ -281,6 +890,10 @@ def main():
         print(f"Error: {e}")
         router.close()
         sys.exit()
+    finally:
+        if router.capture is not None:
+            router.capture.close()
+        stop_logging(listener)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,166 @@
+"""
+Router farm for running many RIP version 2 routers in a single process.
+    Every config file in a directory is loaded into a Router, and the sockets of
+    all routers are multiplexed on one selectors (epoll on Linux) event loop.
+    Every router shares one select_seconds histogram, timing the farm's wait.
+    SIGUSR1 starts and stops profiling every router in the farm.
+    Usage: python3 router_farm.py <config-directory>
+"""
+
+import argparse
+import heapq
+import selectors
+import sys
+from time import perf_counter, time
+from metrics import Histogram
+from packets import *
+from config_loader import load_configs
+from rip_router import Router
+from profiler import DEFAULT_PROFILE_DIR, Profiler
+from router_log import LEVELS, DEFAULT_LEVEL, start_logging, stop_logging
+
+
+def load_routers(source):
+    """ Create a Router for every config in a config directory or snapshot"""
+    return [Router(*config) for config in load_configs(source)]
+
+
+class RouterFarm:
+    """
+    Runs several Routers on one shared selector.
+     - Open every router's sockets with RouterFarm.open()
+     - Start with RouterFarm.run()
+     - Stop with RouterFarm.close()
+    """
+    def __init__(self, routers):
+        self.routers = routers
+        self.selector = selectors.DefaultSelector()
+        self.timers = [] # (wake time, router index), invalidated lazily
+        self.wake_times = [None] * len(routers)
+        self.select_seconds = Histogram()
+        for router in routers:
+            router.metrics.select_seconds = self.select_seconds # every router waits in the same select
+
+
+    def __repr__(self):
+        """ Return a string representation of a RouterFarm object"""
+        return f"RouterFarm({len(self.routers)} routers)"
+
+
+    def open(self):
+        """ Open the sockets of every router and register them with the selector"""
+        for index, router in enumerate(self.routers):
+            router.open()
+            for sock in router.sockets:
+                self.selector.register(sock, selectors.EVENT_READ, index)
+            if router.metrics_socket is not None:
+                self.selector.register(router.metrics_socket, selectors.EVENT_READ, index)
+
+
+    def close(self):
+        """ Close the selector and every router's sockets"""
+        self.selector.close()
+        for router in self.routers:
+            router.close()
+
+
+    def schedule(self, index, wake_time):
+        """ Schedule the timers of a router to run at a given time"""
+        if self.wake_times[index] == wake_time:
+            return # already scheduled
+        self.wake_times[index] = wake_time
+        heapq.heappush(self.timers, (wake_time, index))
+
+
+    def run_timers(self):
+        """ Run the timers of every router that is due, and return the time in
+            seconds until the next router is due"""
+        now = time()
+        while self.timers and self.timers[0][0] <= now:
+            wake_time, index = heapq.heappop(self.timers)
+            if self.wake_times[index] == wake_time:
+                self.wake_times[index] = None
+                self.schedule(index, now + self.routers[index].process_timers())
+        return max(self.timers[0][0] - time(), 0) if self.timers else None
+
+
+    def run(self, on_wake=None, max_wait=None):
+        """ Server loop for every router in the farm. If given, on_wake() is
+            called after every pass of the loop, and the loop never sleeps for
+            longer than max_wait seconds"""
+        for index in range(len(self.routers)):
+            self.schedule(index, time())
+        while True:
+            timeout = self.run_timers()
+            if max_wait is not None and (timeout is None or timeout > max_wait):
+                timeout = max_wait
+            batches = {} # datagrams read for each router index
+            start = perf_counter()
+            events = self.selector.select(timeout)
+            self.select_seconds.observe(perf_counter() - start)
+            for key, _ in events:
+                index = key.data
+                router = self.routers[index]
+                if key.fileobj is router.metrics_socket:
+                    router.answer_metrics_query()
+                    continue
+                router.receive_batch(key.fileobj, batches.setdefault(index, []))
+            for index, batch in batches.items():
+                router = self.routers[index]
+                if batch:
+                    router.handle_packets(batch)
+                event_time = router.get_event_time()
+                if event_time is not None and time() + event_time < self.wake_times[index]:
+                    self.schedule(index, time() + event_time)
+            if on_wake is not None:
+                on_wake()
+
+
+def main():
+    """ main"""
+    parser = argparse.ArgumentParser(description="Run a directory of RIP routers in one process")
+    parser.add_argument("directory", help="directory of router config files, or a snapshot")
+    parser.add_argument(
+        "--log-level", choices=LEVELS, default=DEFAULT_LEVEL,
+        help=f"lowest level of messages to log, 'debug' includes table dumps (default: {DEFAULT_LEVEL})"
+    )
+    parser.add_argument("--log-file", help="write log messages to a file instead of stdout")
+    parser.add_argument(
+        "--metrics-base-port", type=int,
+        help="answer metrics queries for the n-th router (in filename order) on this port + n"
+    )
+    parser.add_argument("--data-plane", action="store_true", help="forward data packets using the forwarding tables")
+    parser.add_argument(
+        "--profile-dir", default=DEFAULT_PROFILE_DIR,
+        help=f"directory for results of profiling started by SIGUSR1 or a metrics query (default: {DEFAULT_PROFILE_DIR})"
+    )
+    args = parser.parse_args()
+    try:
+        farm = RouterFarm(load_routers(args.directory))
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit()
+    for router in farm.routers:
+        router.data_plane = args.data_plane
+    if args.metrics_base_port is not None:
+        for index, router in enumerate(farm.routers):
+            router.metrics_port = args.metrics_base_port + index
+    Profiler(farm.routers, args.profile_dir, "farm").install_signals()
+    print(f"Starting {len(farm.routers)} routers")
+    listener = start_logging(args.log_level, args.log_file, show_names=True)
+    try:
+        farm.open()
+        farm.run()
+    except KeyboardInterrupt:
+        print("Keyboard Interrupt: Stopping Farm")
+        farm.close()
+    except Exception as e:
+        print(f"Error: {e}")
+        farm.close()
+        sys.exit()
+    finally:
+        stop_logging(listener)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Non-blocking logging for RIP version 2 routers.
+    Routers log through the standard logging module under the "rip" logger.
+    Records are put on a queue and written by a background thread, so packet
+    processing never waits on terminal or file I/O.
+"""
+
+import logging
+import logging.handlers
+import queue
+import sys
+from os import path
+
+LOGGER_NAME = "rip"
+LEVELS = ("debug", "info", "warning", "error")
+DEFAULT_LEVEL = "info"
+MESSAGE_FORMAT = "%(message)s"
+NAMED_FORMAT = "%(name)s: %(message)s"
+TIMED_FORMAT = "%(asctime)s %(message)s"
+
+
+def get_router_logger(router_id):
+    """ Get the logger used by a single router"""
+    return logging.getLogger(f"{LOGGER_NAME}.router-{router_id}")
+
+
+def start_logging(level=DEFAULT_LEVEL, filename=None, show_names=False):
+    """ Send router logs at or above a level to stdout, or to a file, through a
+        background writer thread. Returns the listener, which must be stopped
+        with stop_logging() to flush any queued records"""
+    if filename is None:
+        handler = logging.StreamHandler(sys.stdout)
+    else:
+        handler = logging.FileHandler(filename)
+    handler.setFormatter(logging.Formatter(NAMED_FORMAT if show_names else MESSAGE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
+def start_router_logging(router_ids, directory, level=DEFAULT_LEVEL):
+    """ Send the logs of each router to its own file, router-<id>.log in a
+        directory, through one background writer thread. Returns the listener,
+        which must be stopped with stop_logging()"""
+    handlers = []
+    for router_id in router_ids:
+        handler = logging.FileHandler(path.join(directory, f"router-{router_id}.log"))
+        handler.setFormatter(logging.Formatter(TIMED_FORMAT))
+        handler.addFilter(logging.Filter(get_router_logger(router_id).name))
+        handlers.append(handler)
+
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    return listener
+
+
+def stop_logging(listener):
+    """ Flush queued records and stop the background writer"""
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -5,8 +5,13 @@ Max Croucher
 12 Apr, 2023
 """
 
+import argparse
 import multiprocessing
 from os import listdir, path, system
+from router_farm import RouterFarm, load_routers
+from router_log import start_logging, stop_logging
+from config_loader import load_configs, is_snapshot
+from supervisor import Supervisor
 
 ROUTER_FILENAME = "rip_router.py"
 GENERATED_PATH = "generated_config"
@@ -14,25 +19,64 @@ TESTING_PREFIX = "demo_config"
 SUBMISSION_PREFIX = "submission_config"
 CONFIG_SUFFIX = ".txt"
 
-def run_router(router_path):
-    """ Launch a router"""
-    command = f"python3 {ROUTER_FILENAME} {router_path}; bash"
-    name = path.split(router_path)[1]
+def run_router(router_path, router_id=None):
+    """ Launch a router from a config file, or a given router from a snapshot"""
+    if router_id is None:
+        command = f"python3 {ROUTER_FILENAME} --log-level debug {router_path}; bash"
+        name = path.split(router_path)[1]
+    else:
+        command = f"python3 {ROUTER_FILENAME} --log-level debug {router_path} --router-id {router_id}; bash"
+        name = router_id
     system(f"gnome-terminal --title=\"Router {name}\" -- bash -c \"{command}\"")
 
 
 def launch_network(prefix):
-    """Iterate through a given directory and launch a router for each"""
-    id_names = listdir(prefix)
+    """Iterate through a given directory or snapshot and launch a router for each"""
+    configs = load_configs(prefix) # fail before opening any terminal if the network is broken
     processes = []
-    for router_id in id_names:
-        if router_id.endswith(".txt"):
-            processes.append(
-                multiprocessing.Process(target=run_router, args=(path.join(prefix, router_id),))
-            )
+    if is_snapshot(prefix):
+        for config in configs:
+            processes.append(multiprocessing.Process(target=run_router, args=(prefix, config[0])))
+    else:
+        for router_id in listdir(prefix):
+            if router_id.endswith(".txt"):
+                processes.append(
+                    multiprocessing.Process(target=run_router, args=(path.join(prefix, router_id),))
+                )
     for i in processes:
         i.start()
 
 
+def launch_farm(prefix):
+    """Run every router in a given directory inside this process"""
+    farm = RouterFarm(load_routers(prefix))
+    listener = start_logging(show_names=True)
+    try:
+        farm.open()
+        farm.run()
+    except KeyboardInterrupt:
+        print("Keyboard Interrupt: Stopping Farm")
+    finally:
+        farm.close()
+        stop_logging(listener)
+
+
+def launch_headless(prefix, per_core=False):
+    """Run every router in a given directory in supervised worker processes"""
+    Supervisor(load_configs(prefix), multiprocessing.cpu_count() if per_core else None).run()
+
+
 if __name__ == "__main__":
-    launch_network(SUBMISSION_PREFIX)
+    parser = argparse.ArgumentParser(description="Launch a network of RIP routers")
+    parser.add_argument("prefix", nargs="?", default=SUBMISSION_PREFIX, help="directory of router config files, or a snapshot")
+    parser.add_argument("--farm", action="store_true", help="run every router headless in this process")
+    parser.add_argument("--headless", action="store_true", help="run every router in supervised worker processes")
+    parser.add_argument("--per-core", action="store_true", help="with --headless, run one worker per CPU core")
+    args = parser.parse_args()
+    if args.headless:
+        launch_headless(args.prefix, args.per_core)
+    elif args.farm:
+        launch_farm(args.prefix)
+    else:
+        launch_network(args.prefix)
+
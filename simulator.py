@@ -0,0 +1,279 @@
+"""
+Discrete-event simulator for networks of RIP version 2 routers.
+    Routers run unmodified against a virtual clock, and packets are passed
+    through an in-memory transport instead of sockets. Events are taken from a
+    priority queue as fast as possible, so convergence of networks with
+    thousands of routers can be studied without waiting for real timers.
+    Usage: python3 simulator.py <config-directory> [--until <seconds>]
+           python3 simulator.py --generate <number-of-routers> [--until <seconds>]
+"""
+
+import argparse
+import heapq
+import random
+import sys
+from itertools import count
+from time import perf_counter
+import config_builder
+from config_loader import load_configs
+from packets import *
+from rip_router import Router
+from router_log import LEVELS, start_logging, stop_logging
+
+DEFAULT_LATENCY = 0.001
+CHECK_INTERVAL = 1.0
+TIMER_EVENT = 0
+PACKET_EVENT = 1
+
+
+def configs_from_adjacency(adj_list, timers=None):
+    """ Convert an adjacency list from config_builder into router configs.
+        adj_list[a][b] holds the (metric, port) that router a uses to reach b"""
+    if timers is None:
+        timers = (
+            (config_builder.DEFAULT_DELAY, config_builder.DELAY_DELTA),
+            config_builder.ROUTER_TIMEOUT,
+            config_builder.GARBAGE_TIMEOUT,
+            config_builder.TRIGGER_TIMEOUT,
+        )
+    configs = []
+    for router_id in adj_list:
+        input_ports = []
+        outputs = []
+        for neighbour_id, (metric, port) in adj_list[router_id].items():
+            if metric is not None:
+                outputs.append(RoutingEntry(neighbour_id, port, metric, None, None))
+                input_ports.append(adj_list[neighbour_id][router_id][1])
+        configs.append((router_id, input_ports, outputs, timers))
+    return configs
+
+
+def shortest_paths(configs, source_id):
+    """ Find the metric from one router to every router it can reach with a
+        metric below infinity"""
+    links = {router_id: outputs for router_id, _, outputs, _ in configs}
+    distances = {source_id: 0}
+    queue = [(0, source_id)]
+    while queue:
+        distance, router_id = heapq.heappop(queue)
+        if distance > distances[router_id]:
+            continue
+        for neighbour in links.get(router_id, []):
+            cost = distance + neighbour.metric
+            if cost < INF_METRIC and cost < distances.get(neighbour.router_id, INF_METRIC):
+                distances[neighbour.router_id] = cost
+                heapq.heappush(queue, (cost, neighbour.router_id))
+    return distances
+
+
+class SimulatedSocket:
+    """ Stand-in for a router's send socket that hands packets to a Simulator"""
+    def __init__(self, simulator, index):
+        self.simulator = simulator
+        self.index = index
+
+
+    def sendto(self, data, address):
+        self.simulator.send(self.index, address[1], bytes(data))
+
+
+    def close(self):
+        pass
+
+
+class Simulator:
+    """
+    Runs a network of Routers on a virtual clock.
+     - Create with the configs returned by load_configs() or configs_from_adjacency()
+     - Advance with Simulator.run() or Simulator.run_until_converged()
+    """
+    def __init__(self, configs, latency=DEFAULT_LATENCY, seed=None):
+        if seed is not None:
+            random.seed(seed)
+        self.now = 0.0
+        self.latency = latency
+        self.events = [] # (time, sequence, kind, router index, data)
+        self.sequence = count()
+        self.routers = [Router(*config, clock=self.clock) for config in configs]
+        self.configs = configs
+        self.wake_times = [None] * len(self.routers)
+        self.port_owners = {}
+        self.failed_links = set()
+        self.events_processed = 0
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        for index, router in enumerate(self.routers):
+            router.send_socket = SimulatedSocket(self, index)
+            for port in router.input_ports:
+                self.port_owners[port] = index
+            self.schedule_timer(index, self.now)
+
+
+    def __repr__(self):
+        """ Return a string representation of a Simulator object"""
+        return f"Simulator({len(self.routers)} routers, t={self.now:.3f})"
+
+
+    def clock(self):
+        """ The virtual clock given to every router"""
+        return self.now
+
+
+    def push(self, event_time, kind, index, data=None):
+        """ Add an event to the queue"""
+        heapq.heappush(self.events, (event_time, next(self.sequence), kind, index, data))
+
+
+    def schedule_timer(self, index, wake_time):
+        """ Schedule the timers of a router to run at a given time"""
+        if self.wake_times[index] == wake_time:
+            return # already scheduled
+        self.wake_times[index] = wake_time
+        self.push(wake_time, TIMER_EVENT, index)
+
+
+    def send(self, index, port, data):
+        """ Deliver a packet from a router to the router listening on a port"""
+        self.packets_sent += 1
+        self.bytes_sent += len(data)
+        receiver = self.port_owners.get(port)
+        if receiver is None:
+            return
+        link = (self.routers[index].router_id, self.routers[receiver].router_id)
+        if link not in self.failed_links:
+            self.push(self.now + self.latency, PACKET_EVENT, receiver, (port, data))
+
+
+    def fail_link(self, router_a, router_b):
+        """ Drop all packets between two routers in both directions"""
+        self.failed_links.add((router_a, router_b))
+        self.failed_links.add((router_b, router_a))
+        self.configs = [
+            (router_id, input_ports, [
+                neighbour for neighbour in outputs
+                if (router_id, neighbour.router_id) not in self.failed_links
+            ], timers)
+            for router_id, input_ports, outputs, timers in self.configs
+        ]
+
+
+    def step(self):
+        """ Process the next event"""
+        event_time, _, kind, index, data = heapq.heappop(self.events)
+        self.now = event_time
+        router = self.routers[index]
+        if kind == TIMER_EVENT:
+            if self.wake_times[index] == event_time:
+                self.wake_times[index] = None
+                self.schedule_timer(index, self.now + router.process_timers())
+        else:
+            port, data = data
+            router.handle_packet(data, port)
+            event_time = router.get_event_time()
+            if event_time is not None and self.now + event_time < self.wake_times[index]:
+                self.schedule_timer(index, self.now + event_time)
+        self.events_processed += 1
+
+
+    def run(self, until):
+        """ Process events until the virtual clock reaches a given time"""
+        while self.events and self.events[0][0] <= until:
+            self.step()
+        self.now = max(self.now, until)
+
+
+    def tables(self):
+        """ Get the metric to every reachable destination known by each router"""
+        return {
+            router.router_id: {
+                destination: metric
+                for destination, metric in router.forwarding_table.metric_items()
+                if metric < INF_METRIC
+            }
+            for router in self.routers
+        }
+
+
+    def expected_tables(self):
+        """ Get the tables every router should hold once the network converges"""
+        expected = {}
+        for router_id, _, _, _ in self.configs:
+            distances = shortest_paths(self.configs, router_id)
+            distances.pop(router_id)
+            expected[router_id] = distances
+        return expected
+
+
+    def converged(self, expected=None):
+        """ Check whether every router holds the shortest path to every router"""
+        if expected is None:
+            expected = self.expected_tables()
+        return self.tables() == expected
+
+
+    def run_until_converged(self, until, check_interval=CHECK_INTERVAL):
+        """ Run until every router holds correct routes, checking at a given
+            interval. Returns the virtual time of convergence, or None"""
+        expected = self.expected_tables()
+        while self.now < until:
+            self.run(min(self.now + check_interval, until))
+            if self.converged(expected):
+                return self.now
+        return None
+
+
+def main():
+    """ main"""
+    parser = argparse.ArgumentParser(description="Simulate a network of RIP routers")
+    parser.add_argument("directory", nargs="?", help="directory of router config files, or a snapshot")
+    parser.add_argument("--generate", type=int, metavar="N", help="simulate a generated network of N routers")
+    parser.add_argument(
+        "--topology", choices=config_builder.TOPOLOGIES, default=config_builder.DEFAULT_TOPOLOGY,
+        help=f"topology of a generated network (default: {config_builder.DEFAULT_TOPOLOGY})"
+    )
+    parser.add_argument(
+        "--degree", type=float, default=config_builder.DEFAULT_DEGREE,
+        help=f"average links per router in a generated network (default: {config_builder.DEFAULT_DEGREE})"
+    )
+    parser.add_argument("--until", type=float, default=600, help="virtual seconds to simulate (default: 600)")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="link latency in seconds")
+    parser.add_argument("--seed", type=int, help="seed for timers and generated networks")
+    parser.add_argument(
+        "--log-level", choices=LEVELS, default="warning",
+        help="lowest level of router messages to show (default: warning)"
+    )
+    args = parser.parse_args()
+    if (args.directory is None) == (args.generate is None):
+        parser.error("give either a config directory or --generate")
+
+    try:
+        if args.generate is not None:
+            random.seed(args.seed)
+            ids = config_builder.random_router_ids(args.generate)
+            configs = configs_from_adjacency(config_builder.generate_adjacency_list(ids, args.topology, args.degree))
+        else:
+            configs = load_configs(args.directory)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit()
+
+    listener = start_logging(args.log_level, show_names=True)
+    simulator = Simulator(configs, args.latency, args.seed)
+    start = perf_counter()
+    try:
+        converged_at = simulator.run_until_converged(args.until)
+    finally:
+        stop_logging(listener)
+    elapsed = perf_counter() - start
+
+    print(f"Simulated {len(simulator.routers)} routers for {simulator.now:.1f} virtual seconds")
+    if converged_at is None:
+        print("    Network did not converge")
+    else:
+        print(f"    Converged after {converged_at:.1f} virtual seconds")
+    print(f"    {simulator.events_processed} events, {simulator.packets_sent} packets, {simulator.bytes_sent} bytes")
+    print(f"    {elapsed:.2f} seconds of real time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Headless supervisor for networks of RIP version 2 routers.
+    Runs the routers of a config directory in worker processes, either one
+    worker per router or a fixed number of workers (such as one per CPU core)
+    each running several routers in a RouterFarm. Each router logs to its own
+    file and anything else a worker prints, such as the traceback of a crash,
+    goes to a log file for the worker. Workers that exit are restarted, and
+    every worker is stopped on SIGTERM or a keyboard interrupt.
+    Workers report the liveness and table size of their routers through
+    shared memory, which the supervisor prints as a status table.
+    With --checkpoint-dir, each router checkpoints its forwarding table, and a
+    restarted worker restores the tables of its routers from their checkpoints.
+    Sending SIGUSR1 to a worker starts and stops profiling its routers, with
+    results written to the log directory.
+    The network is loaded and cross-checked before any worker starts.
+    Usage: python3 supervisor.py <config-directory-or-snapshot> [--per-core | --workers N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+from time import time, sleep
+from config_loader import load_configs
+from rip_router import Router
+from router_farm import RouterFarm
+from profiler import Profiler
+from router_log import LEVELS, DEFAULT_LEVEL, start_router_logging, stop_logging
+
+DEFAULT_LOG_DIR = "router_logs"
+HEARTBEAT_INTERVAL = 1 # seconds between status reports from a worker
+LIVENESS_TIMEOUT = 5 # a router that has not reported for this long is down
+POLL_INTERVAL = 0.5
+DEFAULT_STATUS_INTERVAL = 10
+STOP_TIMEOUT = 5 # seconds to wait for workers to exit before killing them
+RESTART_DELAY = 1 # doubled for every crash in a row, up to MAX_RESTART_DELAY
+MAX_RESTART_DELAY = 30
+STABLE_TIME = 60 # a worker that runs this long resets its crash count
+
+
+def stop_worker(signum, frame):
+    """ SIGTERM handler for workers, which unwinds the worker so its sockets
+        are closed and its logs are flushed"""
+    raise SystemExit(0)
+
+
+def run_worker(index, configs, slots, heartbeats, table_sizes, log_dir, level, metrics_base_port, checkpoint_dir):
+    """ Run the routers of one worker in a RouterFarm until the worker is sent
+        SIGTERM, reporting their status in the shared heartbeats and
+        table_sizes arrays at the given slots"""
+    signal.signal(signal.SIGTERM, stop_worker)
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # the supervisor stops workers itself
+
+    output = open(os.path.join(log_dir, f"worker-{index}.log"), "a")
+    os.dup2(output.fileno(), sys.stdout.fileno())
+    os.dup2(output.fileno(), sys.stderr.fileno())
+    print(f"Worker {index} (pid {os.getpid()}) starting at {time():.3f}", flush=True)
+
+    routers = [Router(*config) for config in configs]
+    if metrics_base_port is not None:
+        for slot, router in zip(slots, routers):
+            router.metrics_port = metrics_base_port + slot
+    listener = start_router_logging([router.router_id for router in routers], log_dir, level)
+    Profiler(routers, log_dir, f"worker-{index}").install_signals()
+    if checkpoint_dir is not None:
+        for router in routers:
+            router.checkpoint_file = os.path.join(checkpoint_dir, f"router-{router.router_id}.table")
+            try:
+                router.restore_checkpoint()
+            except Exception as e:
+                router.logger.warning(f"Could not restore the forwarding table, starting with an empty table. {e}")
+    farm = RouterFarm(routers)
+    next_report = 0
+
+    def report():
+        """ Write the status of every router to shared memory, at most once
+            per HEARTBEAT_INTERVAL"""
+        nonlocal next_report
+        now = time()
+        if now < next_report:
+            return
+        next_report = now + HEARTBEAT_INTERVAL
+        for slot, router in zip(slots, routers):
+            table_sizes[slot] = len(router.forwarding_table)
+            heartbeats[slot] = now
+
+    try:
+        farm.open()
+        report()
+        farm.run(report, HEARTBEAT_INTERVAL)
+    finally:
+        farm.close()
+        stop_logging(listener)
+        print(f"Worker {index} stopped at {time():.3f}", flush=True)
+
+
+class Supervisor:
+    """
+    Starts, watches and stops the worker processes running a network.
+     - Start with Supervisor.run(), which returns once the supervisor is sent
+       SIGTERM or a keyboard interrupt and every worker has stopped
+     - Router status is kept in the shared heartbeats and table_sizes arrays,
+       one element per config
+    """
+    def __init__(self, configs, workers=None, log_dir=DEFAULT_LOG_DIR,
+                 level=DEFAULT_LEVEL, metrics_base_port=None, status_interval=DEFAULT_STATUS_INTERVAL,
+                 checkpoint_dir=None):
+        if not configs:
+            raise Exception("No routers to run")
+        self.configs = configs
+        self.router_ids = [config[0] for config in configs]
+        if workers is None:
+            workers = len(configs)
+        workers = max(1, min(workers, len(configs)))
+
+        # Routers are dealt to workers in turn, so each gets a similar share
+        self.groups = [list(range(index, len(configs), workers)) for index in range(workers)]
+        self.worker_of = {slot: index for index, slots in enumerate(self.groups) for slot in slots}
+        self.log_dir = log_dir
+        self.level = level
+        self.metrics_base_port = metrics_base_port
+        self.status_interval = status_interval
+        self.checkpoint_dir = checkpoint_dir
+
+        # Each element is only written by the worker running that router
+        self.heartbeats = multiprocessing.RawArray('d', len(configs))
+        self.table_sizes = multiprocessing.RawArray('i', len(configs))
+
+        self.processes = [None] * workers
+        self.start_times = [None] * workers
+        self.restart_times = [None] * workers # when a crashed worker is due to restart
+        self.crashes = [0] * workers # crashes in a row, for the restart delay
+        self.restarts = [0] * workers
+        self.stopping = False
+
+
+    def __repr__(self):
+        """ Return a string representation of a Supervisor object"""
+        return f"Supervisor({len(self.configs)} routers, {len(self.groups)} workers)"
+
+
+    def start_worker(self, index):
+        """ Start the worker process for a group of routers"""
+        slots = self.groups[index]
+        process = multiprocessing.Process(
+            target=run_worker,
+            name=f"rip-worker-{index}",
+            args=(
+                index, [self.configs[slot] for slot in slots], slots,
+                self.heartbeats, self.table_sizes, self.log_dir, self.level, self.metrics_base_port,
+                self.checkpoint_dir,
+            ),
+        )
+        process.start()
+        self.processes[index] = process
+        self.start_times[index] = time()
+        self.restart_times[index] = None
+
+
+    def check_workers(self):
+        """ Schedule a restart for every worker that has exited, and restart
+            the workers that are due"""
+        now = time()
+        for index, process in enumerate(self.processes):
+            if self.restart_times[index] is not None:
+                if now >= self.restart_times[index]:
+                    self.restarts[index] += 1
+                    self.start_worker(index)
+                continue
+            if process.is_alive():
+                continue
+            process.join()
+            if now - self.start_times[index] >= STABLE_TIME:
+                self.crashes[index] = 0
+            self.crashes[index] += 1
+            delay = min(RESTART_DELAY * 2 ** (self.crashes[index] - 1), MAX_RESTART_DELAY)
+            self.restart_times[index] = now + delay
+            routers = ", ".join(str(self.router_ids[slot]) for slot in self.groups[index])
+            print(
+                f"Worker {index} (routers {routers}) exited with code {process.exitcode}, "
+                f"restarting in {delay:g} seconds"
+            )
+
+
+    def status(self):
+        """ Get a (router id, alive, table size, restarts) tuple for every router"""
+        now = time()
+        return [
+            (
+                router_id,
+                now - self.heartbeats[slot] < LIVENESS_TIMEOUT,
+                self.table_sizes[slot],
+                self.restarts[self.worker_of[slot]],
+            )
+            for slot, router_id in enumerate(self.router_ids)
+        ]
+
+
+    def print_status(self):
+        """ Print the status of every router"""
+        status = self.status()
+        alive = sum(1 for _, is_alive, _, _ in status if is_alive)
+        print(f"{alive}/{len(status)} routers alive")
+        print(f"{'Router':>8}{'State':>8}{'Routes':>8}{'Restarts':>10}")
+        for router_id, is_alive, table_size, restarts in status:
+            print(f"{router_id:>8}{'up' if is_alive else 'down':>8}{table_size:>8}{restarts:>10}")
+
+
+    def request_stop(self, signum=None, frame=None):
+        """ Signal handler that makes Supervisor.run() stop every worker"""
+        self.stopping = True
+
+
+    def stop(self):
+        """ Send SIGTERM to every worker, and kill any that have not exited
+            within STOP_TIMEOUT seconds"""
+        running = [process for process in self.processes if process is not None and process.is_alive()]
+        for process in running:
+            process.terminate()
+        deadline = time() + STOP_TIMEOUT
+        for process in running:
+            process.join(max(deadline - time(), 0))
+        for process in running:
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+
+    def run(self):
+        """ Start every worker and supervise them until asked to stop"""
+        os.makedirs(self.log_dir, exist_ok=True)
+        if self.checkpoint_dir is not None:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        print(f"Starting {len(self.configs)} routers in {len(self.groups)} workers, logging to {self.log_dir}")
+        try:
+            for index in range(len(self.groups)):
+                self.start_worker(index)
+            next_status = time() + self.status_interval
+            while not self.stopping:
+                self.check_workers()
+                if self.status_interval and time() >= next_status:
+                    self.print_status()
+                    next_status = time() + self.status_interval
+                sleep(POLL_INTERVAL)
+        finally:
+            print("Stopping all routers")
+            self.stop()
+
+
+def main():
+    """ main"""
+    parser = argparse.ArgumentParser(description="Run and supervise a network of RIP routers without terminals")
+    parser.add_argument("directory", help="directory of router config files, or a snapshot")
+    workers = parser.add_mutually_exclusive_group()
+    workers.add_argument("--workers", type=int, help="number of worker processes (default: one per router)")
+    workers.add_argument("--per-core", action="store_true", help="run one worker per CPU core")
+    parser.add_argument("--log-dir", default=DEFAULT_LOG_DIR, help=f"directory for log files (default: {DEFAULT_LOG_DIR})")
+    parser.add_argument(
+        "--log-level", choices=LEVELS, default=DEFAULT_LEVEL,
+        help=f"lowest level of messages to log, 'debug' includes table dumps (default: {DEFAULT_LEVEL})"
+    )
+    parser.add_argument(
+        "--metrics-base-port", type=int,
+        help="answer metrics queries for the n-th router (in filename order) on this port + n"
+    )
+    parser.add_argument(
+        "--status-interval", type=float, default=DEFAULT_STATUS_INTERVAL,
+        help=f"seconds between status tables, 0 for none (default: {DEFAULT_STATUS_INTERVAL})"
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        help="checkpoint each router's forwarding table in this directory, and restore it when a worker starts"
+    )
+    args = parser.parse_args()
+    try:
+        supervisor = Supervisor(
+            load_configs(args.directory),
+            os.cpu_count() if args.per_core else args.workers,
+            args.log_dir, args.log_level, args.metrics_base_port, args.status_interval,
+            args.checkpoint_dir,
+        )
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit()
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
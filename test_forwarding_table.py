@@ -0,0 +1,153 @@
+"""
+Tests for the array backed forwarding table and its checkpoints.
+    Run with: python3 -m pytest test_forwarding_table.py (or python3 -m unittest test_forwarding_table)
+"""
+
+import os
+import tempfile
+import unittest
+from math import isnan
+from forwarding_table import *
+from packets import RoutingEntry
+
+ROUTER_ID = 3
+SAVED_AT = 1000.0
+
+
+class ForwardingTableTest(unittest.TestCase):
+    def test_add_and_get(self):
+        table = ForwardingTable()
+        table.add(10, 2, 5, 1.5, None)
+        table[11] = RoutingEntry(4, None, 7, None, 2.5)
+        self.assertEqual(len(table), 2)
+        self.assertIn(10, table)
+        self.assertNotIn(12, table)
+        self.assertIsNone(table.get(12))
+        route = table[10]
+        self.assertEqual((route.router_id, route.metric, route.timeout, route.garbage), (2, 5, 1.5, None))
+        route = table.get(11)
+        self.assertEqual((route.router_id, route.metric, route.timeout, route.garbage), (4, 7, None, 2.5))
+        self.assertEqual(list(table), [10, 11])
+        self.assertEqual(dict(table.metric_items()), {10: 5, 11: 7})
+
+
+    def test_nan_stands_for_none(self):
+        table = ForwardingTable()
+        table.add(10, 2, 5, None, None)
+        slot = table.slots[10]
+        self.assertTrue(isnan(table.timeouts[slot]))
+        self.assertTrue(isnan(table.garbages[slot]))
+        route = table[10]
+        self.assertIsNone(route.timeout)
+        route.timeout = 4.0
+        self.assertEqual(table.timeouts[slot], 4.0)
+        route.timeout = None
+        self.assertTrue(isnan(table.timeouts[slot]))
+        route.garbage = 0.0
+        self.assertEqual(route.garbage, 0.0) # zero is a time, not None
+
+
+    def test_route_view_writes_through(self):
+        table = ForwardingTable()
+        table.add(10, 2, 5, 1.0, None)
+        route = table[10]
+        route.router_id = 6
+        route.metric = 9
+        self.assertEqual((table[10].router_id, table[10].metric), (6, 9))
+
+
+    def test_replace_keeps_slot(self):
+        table = ForwardingTable()
+        table.add(10, 2, 5, 1.0, None)
+        slot = table.slots[10]
+        table.add(10, 3, 6, 2.0, None)
+        self.assertEqual(table.slots[10], slot)
+        self.assertEqual(len(table.metrics), 1)
+        self.assertEqual(table[10].router_id, 3)
+
+
+    def test_slot_reuse_after_pop(self):
+        table = ForwardingTable()
+        for destination in range(10, 15):
+            table.add(destination, 2, 5, 1.0, None)
+        freed = table.slots[12]
+        table.pop(12)
+        self.assertNotIn(12, table)
+        self.assertEqual(len(table), 4)
+        table.add(20, 4, 8, None, 3.0)
+        self.assertEqual(table.slots[20], freed)
+        self.assertEqual(len(table.metrics), 5) # no array grew
+        route = table[20]
+        self.assertEqual((route.router_id, route.metric, route.timeout, route.garbage), (4, 8, None, 3.0))
+        self.assertEqual(table[13].metric, 5)
+        with self.assertRaises(KeyError):
+            table.pop(12)
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "table.ckpt")
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_round_trip(self):
+        table = ForwardingTable()
+        table.add(10, 2, 5, 990.0, None)
+        table.add(11, 4, 16, None, 995.0) # timed out, so not saved
+        table.add(12, 4, 1, 999.5, None)
+        table.add(13, 2, 3, 998.0, None) # restored, last heard at 900
+        write_checkpoint(self.filename, ROUTER_ID, table, SAVED_AT, {13: 900.0})
+        self.assertFalse(os.path.exists(self.filename + ".tmp"))
+        router_id, saved_at, routes = read_checkpoint(self.filename)
+        self.assertEqual((router_id, saved_at), (ROUTER_ID, SAVED_AT))
+        self.assertEqual(sorted(routes), [
+            (10, 2, 5, 990.0, 990.0, False),
+            (12, 4, 1, 999.5, 999.5, False),
+            (13, 2, 3, 900.0, 998.0, True),
+        ])
+
+
+    def test_empty_table(self):
+        write_checkpoint(self.filename, ROUTER_ID, ForwardingTable(), SAVED_AT)
+        self.assertEqual(read_checkpoint(self.filename), (ROUTER_ID, SAVED_AT, []))
+
+
+    def test_truncated(self):
+        table = ForwardingTable()
+        table.add(10, 2, 5, 990.0, None)
+        write_checkpoint(self.filename, ROUTER_ID, table, SAVED_AT)
+        with open(self.filename, "rb") as checkpoint:
+            data = checkpoint.read()
+        for length in (len(data) - 1, CHECKPOINT_HEADER.size, CHECKPOINT_HEADER.size - 1, 0):
+            with self.subTest(length=length):
+                with open(self.filename, "wb") as checkpoint:
+                    checkpoint.write(data[:length])
+                with self.assertRaises(Exception):
+                    read_checkpoint(self.filename)
+
+
+    def test_bad_magic(self):
+        with open(self.filename, "wb") as checkpoint:
+            checkpoint.write(CHECKPOINT_HEADER.pack(b"RIPC", CHECKPOINT_VERSION, ROUTER_ID, SAVED_AT, 0))
+        with self.assertRaisesRegex(Exception, "not a checkpoint"):
+            read_checkpoint(self.filename)
+
+
+    def test_bad_version(self):
+        with open(self.filename, "wb") as checkpoint:
+            checkpoint.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION + 1, ROUTER_ID, SAVED_AT, 0))
+        with self.assertRaisesRegex(Exception, "version"):
+            read_checkpoint(self.filename)
+
+
+    def test_missing(self):
+        with self.assertRaisesRegex(Exception, "Cannot read"):
+            read_checkpoint(self.filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests for splitting advertisements across RIP packets.
+    Run with: python3 -m pytest test_packets.py (or python3 -m unittest test_packets)
+"""
+
+import math
+import unittest
+from packets import *
+
+SENDER_ID = 7
+TABLE_SIZES = (1, 24, 25, 26, 1000, 4999, 5000)
+
+
+def make_routes(count):
+    """ Build (family id, router id, metric) routes to count destinations"""
+    return [(ADDRESS_FAMILY, destination, destination % INF_METRIC + 1) for destination in range(1, count + 1)]
+
+
+class GeneratePacketsTest(unittest.TestCase):
+    def check_packets(self, packets, routes):
+        """ Check packets carry routes in order, 25 to a packet"""
+        self.assertEqual(len(packets), math.ceil(len(routes) / MAX_ENTRIES))
+        decoded = []
+        for packet in packets:
+            self.assertLessEqual(len(packet), MAX_PACKET_SIZE)
+            command, version, sender_id, entries = decode_packet(packet)
+            self.assertEqual((command, version, sender_id), (RESPONSE_COMMAND, RIP_VERSION, SENDER_ID))
+            self.assertTrue(1 <= len(entries) <= MAX_ENTRIES)
+            decoded.extend(entries)
+        self.assertEqual(decoded, routes)
+
+
+    def test_generate_packets(self):
+        for count in TABLE_SIZES:
+            with self.subTest(routes=count):
+                routes = make_routes(count)
+                entries = [generate_entry(*route) for route in routes]
+                packets = list(generate_packets(RESPONSE_COMMAND, RIP_VERSION, SENDER_ID, entries))
+                self.check_packets(packets, routes)
+
+
+    def test_split_packets(self):
+        for count in TABLE_SIZES:
+            with self.subTest(routes=count):
+                routes = make_routes(count)
+                body = b"".join(generate_entry(*route) for route in routes)
+                self.check_packets(split_packets(RESPONSE_COMMAND, RIP_VERSION, SENDER_ID, body), routes)
+
+
+    def test_no_entries(self):
+        self.assertEqual(list(generate_packets(RESPONSE_COMMAND, RIP_VERSION, SENDER_ID, [])), [])
+
+
+    def test_too_many_entries(self):
+        entries = [generate_entry(*route) for route in make_routes(MAX_ENTRIES + 1)]
+        with self.assertRaises(Exception):
+            generate_packet(RESPONSE_COMMAND, RIP_VERSION, SENDER_ID, entries)
+
+
+if __name__ == "__main__":
+    unittest.main()
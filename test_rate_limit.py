@@ -0,0 +1,44 @@
+"""
+Tests for token bucket rate limiting.
+    Run with: python3 -m pytest test_rate_limit.py (or python3 -m unittest test_rate_limit)
+"""
+
+import unittest
+from rate_limit import TokenBucket
+
+RATE = 10
+BURST = 5
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(RATE, BURST, 0.0)
+        self.assertEqual([bucket.take(0.0) for _ in range(BURST + 1)], [True] * BURST + [False])
+        self.assertTrue(bucket.take(1 / RATE))
+        self.assertFalse(bucket.take(1 / RATE))
+
+
+    def test_refill_is_capped_at_burst(self):
+        bucket = TokenBucket(RATE, BURST, 0.0)
+        self.assertEqual(sum(bucket.take(100.0) for _ in range(BURST * 2)), BURST)
+
+
+    def test_resize_adds_no_tokens(self):
+        bucket = TokenBucket(RATE, BURST, 0.0)
+        for _ in range(BURST):
+            bucket.take(0.0)
+        bucket.resize(BURST * 10)
+        self.assertFalse(bucket.take(0.0))
+        # The extra room fills at the refill rate
+        self.assertEqual(sum(bucket.take(2.0) for _ in range(BURST * 10)), 2 * RATE)
+        self.assertEqual(sum(bucket.take(100.0) for _ in range(BURST * 20)), BURST * 10)
+
+
+    def test_resize_never_shrinks(self):
+        bucket = TokenBucket(RATE, BURST, 0.0)
+        bucket.resize(1)
+        self.assertEqual(bucket.burst, BURST)
+
+
+if __name__ == "__main__":
+    unittest.main()
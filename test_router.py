@@ -0,0 +1,288 @@
+"""
+Tests for the Router class, run without opening any sockets.
+    Run with: python3 -m pytest test_router.py (or python3 -m unittest test_router)
+"""
+
+import os
+import tempfile
+import unittest
+from packets import *
+from rip_router import Router, MAX_RATE_BURST
+
+ROUTER_ID = 1
+NUM_NEIGHBOURS = 4
+NUM_ROUTES = 5000
+FIRST_PORT = 40000
+TIMERS = ((30, 5), 180, 300, (1, 5))
+
+
+class RecordingSocket:
+    """ Send socket that keeps every (data, address) datagram sent through it"""
+    def __init__(self):
+        self.sent = []
+
+
+    def sendto(self, data, address):
+        self.sent.append((bytes(data), address))
+
+
+    def close(self):
+        pass
+
+
+def make_router(num_routes=NUM_ROUTES, num_neighbours=NUM_NEIGHBOURS):
+    """ Create a Router with neighbours and learned routes to num_routes
+        destinations, spread across its neighbours"""
+    outputs = [
+        RoutingEntry(ROUTER_ID + i + 1, FIRST_PORT + i, 1, None, None)
+        for i in range(num_neighbours)
+    ]
+    router = Router(ROUTER_ID, [FIRST_PORT - 1], outputs, TIMERS, clock=lambda: 0.0)
+    for destination in range(num_routes):
+        next_hop = outputs[destination % num_neighbours].router_id
+        router.forwarding_table.add(1000 + destination, next_hop, destination % (INF_METRIC - 1) + 1, 0.0, None)
+    router.invalidate_adverts()
+    router.send_socket = RecordingSocket()
+    return router
+
+
+def expected_entries(router, neighbour):
+    """ The (family id, destination, metric) entries a router should advertise
+        to a neighbour, with poisoned reverse"""
+    entries = {(ADDRESS_FAMILY, router.router_id, 0)}
+    for destination, route in router.forwarding_table.items():
+        metric = INF_METRIC if route.router_id == neighbour.router_id else route.metric
+        entries.add((ADDRESS_FAMILY, destination, metric))
+    return entries
+
+
+class SendForwardingTableTest(unittest.TestCase):
+    def decode_datagrams(self, datagrams):
+        """ Check every datagram is a RIP response of at most 25 entries, and
+            return all of their entries"""
+        entries = []
+        for data in datagrams:
+            self.assertLessEqual(len(data), MAX_PACKET_SIZE)
+            command, version, sender_id, packet_entries = decode_packet(data)
+            self.assertEqual((command, version, sender_id), (RESPONSE_COMMAND, RIP_VERSION, ROUTER_ID))
+            self.assertTrue(1 <= len(packet_entries) <= MAX_ENTRIES)
+            entries.extend(packet_entries)
+        return entries
+
+
+    def test_send_forwarding_table(self):
+        router = make_router()
+        router.send_forwarding_table()
+        for neighbour in router.outputs:
+            with self.subTest(neighbour=neighbour.router_id):
+                datagrams = [data for data, address in router.send_socket.sent if address[1] == neighbour.port]
+                entries = self.decode_datagrams(datagrams)
+                self.assertEqual(len(entries), NUM_ROUTES + 1)
+                self.assertEqual(set(entries), expected_entries(router, neighbour))
+
+
+    def test_advert_packets_for(self):
+        router = make_router()
+        router.refresh_adverts()
+        for neighbour in router.outputs:
+            with self.subTest(neighbour=neighbour.router_id):
+                entries = self.decode_datagrams(router.advert_packets_for(neighbour))
+                self.assertEqual(set(entries), expected_entries(router, neighbour))
+
+
+    def test_triggered_update(self):
+        router = make_router()
+        changed = list(router.forwarding_table)[::7]
+        router.refresh_adverts()
+        for neighbour in router.outputs:
+            with self.subTest(neighbour=neighbour.router_id):
+                entries = self.decode_datagrams(router.advert_packets_for(neighbour, changed))
+                self.assertEqual([destination for _, destination, _ in entries], changed)
+
+
+class ApplyEntriesTest(unittest.TestCase):
+    def setUp(self):
+        self.router = make_router(0, 2)
+        self.first, self.second = (neighbour.router_id for neighbour in self.router.outputs)
+
+
+    def route(self, destination):
+        route = self.router.forwarding_table[destination]
+        return route.router_id, route.metric, route.timeout, route.garbage
+
+
+    def test_add_route(self):
+        self.assertTrue(self.router.apply_entries(self.first, [(ADDRESS_FAMILY, 50, 3)], 1.0))
+        self.assertEqual(self.route(50), (self.first, 4, 1.0, None))
+        self.assertEqual(self.router.metrics.routes_added, 1)
+
+
+    def test_ignored_entries(self):
+        entries = [(ADDRESS_FAMILY, ROUTER_ID, 1), (ADDRESS_FAMILY, 50, INF_METRIC), (7, 51, 1), (ADDRESS_FAMILY, 52, INF_METRIC + 1)]
+        self.assertFalse(self.router.apply_entries(self.first, entries, 1.0))
+        self.assertEqual(len(self.router.forwarding_table), 0)
+        self.assertEqual(self.router.metrics.entries_invalid, 2)
+
+
+    def test_refresh_from_next_hop(self):
+        self.router.apply_entries(self.first, [(ADDRESS_FAMILY, 50, 3)], 1.0)
+        self.assertFalse(self.router.apply_entries(self.first, [(ADDRESS_FAMILY, 50, 3)], 2.0))
+        self.assertEqual(self.route(50), (self.first, 4, 2.0, None))
+        self.assertFalse(self.router.apply_entries(self.second, [(ADDRESS_FAMILY, 50, 3)], 3.0))
+        self.assertEqual(self.route(50), (self.first, 4, 2.0, None)) # not refreshed by another router
+
+
+    def test_better_route(self):
+        self.router.apply_entries(self.first, [(ADDRESS_FAMILY, 50, 3)], 1.0)
+        self.assertTrue(self.router.apply_entries(self.second, [(ADDRESS_FAMILY, 50, 1)], 2.0))
+        self.assertEqual(self.route(50), (self.second, 2, 2.0, None))
+        self.assertEqual(self.router.metrics.routes_changed, 1)
+
+
+    def test_poisoned_by_next_hop(self):
+        self.router.apply_entries(self.first, [(ADDRESS_FAMILY, 50, 3)], 1.0)
+        self.assertTrue(self.router.apply_entries(self.first, [(ADDRESS_FAMILY, 50, INF_METRIC)], 2.0))
+        self.assertEqual(self.route(50), (self.first, INF_METRIC, None, 2.0))
+        # A route waiting for garbage collection is replaced like a new one
+        self.assertTrue(self.router.apply_entries(self.second, [(ADDRESS_FAMILY, 50, 5)], 3.0))
+        self.assertEqual(self.route(50), (self.second, 6, 3.0, None))
+
+
+    def test_provisional_route_confirmed(self):
+        self.router.forwarding_table.add(50, self.first, 4, 0.0, None)
+        self.router.provisional_routes[50] = 0.0
+        self.router.apply_entries(self.second, [(ADDRESS_FAMILY, 50, 5)], 1.0)
+        self.assertIn(50, self.router.provisional_routes) # a worse route from another router
+        self.router.apply_entries(self.first, [(ADDRESS_FAMILY, 50, 3)], 2.0)
+        self.assertNotIn(50, self.router.provisional_routes)
+        self.assertEqual(self.router.metrics.routes_confirmed, 1)
+
+
+class RateLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.router = make_router(0, 2)
+        self.router.clock = lambda: self.now
+        self.sender = self.router.outputs[0].router_id
+        self.next_destination = 1000
+
+
+    def new_destinations(self):
+        """ A datagram from the sender advertising 25 destinations it has not
+            advertised before"""
+        entries = [generate_entry(ADDRESS_FAMILY, self.next_destination + i, 1) for i in range(MAX_ENTRIES)]
+        self.next_destination += MAX_ENTRIES
+        return bytes(generate_packet(RESPONSE_COMMAND, RIP_VERSION, self.sender, entries))
+
+
+    def flood(self, count, port=FIRST_PORT - 1):
+        for _ in range(count):
+            self.router.handle_packet(self.new_destinations(), port)
+
+
+    def test_flood_of_new_destinations(self):
+        router = self.router
+        self.flood(20000)
+        admitted = router.rate_burst
+        self.assertEqual(router.metrics.packets_rate_limited[FIRST_PORT - 1], 20000 - admitted)
+        self.assertEqual(len(router.forwarding_table), admitted * MAX_ENTRIES)
+        # A second of refill admits rate_limit packets, however large the
+        # table has made the burst
+        self.now += 1.0
+        self.flood(20000)
+        self.assertEqual(router.metrics.packets_rate_limited[FIRST_PORT - 1], 40000 - admitted - router.rate_limit)
+        self.assertEqual(len(router.forwarding_table), (admitted + router.rate_limit) * MAX_ENTRIES)
+
+
+    def test_burst_is_capped(self):
+        router = self.router
+        router.rate_burst = 1
+        for destination in range(MAX_RATE_BURST * MAX_ENTRIES):
+            router.forwarding_table.add(destination + 1000, self.sender, 2, 0.0, None)
+        self.assertEqual(router.get_rate_burst(), MAX_RATE_BURST)
+        router.rate_burst = MAX_RATE_BURST * 2
+        self.assertEqual(router.get_rate_burst(), MAX_RATE_BURST * 2)
+
+
+class CheckpointRestoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "router.table")
+        self.now = 0.0
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def restart(self):
+        """ Start a new router at the current time and restore its checkpoint"""
+        router = make_router(0, 2)
+        router.clock = lambda: self.now
+        router.checkpoint_file = self.filename
+        router.restore_checkpoint()
+        return router
+
+
+    def test_restarts_never_extend_an_unconfirmed_route(self):
+        router = self.restart()
+        next_hop = router.outputs[0].router_id
+        router.apply_entries(next_hop, [(ADDRESS_FAMILY, 50, 1)], self.now)
+        router.checkpoint_table()
+
+        # Down for most of the route timeout, so kept for the grace period
+        self.now = 150.0
+        router = self.restart()
+        self.assertEqual(router.provisional_routes, {50: 0.0})
+        deadline = router.route_deadline(router.forwarding_table[50])
+        self.assertGreater(deadline, self.now)
+
+        # Restarting inside the grace period keeps the same deadline
+        self.now = 160.0
+        router.checkpoint_table()
+        self.now = 170.0
+        router = self.restart()
+        self.assertEqual(router.provisional_routes, {50: 0.0})
+        self.assertEqual(router.route_deadline(router.forwarding_table[50]), deadline)
+
+        # and restarting after it drops the route
+        router.checkpoint_table()
+        self.now = deadline + 1
+        router = self.restart()
+        self.assertNotIn(50, router.forwarding_table)
+
+
+    def test_confirmed_route_is_saved_as_heard(self):
+        router = self.restart()
+        next_hop = router.outputs[0].router_id
+        router.apply_entries(next_hop, [(ADDRESS_FAMILY, 50, 1)], self.now)
+        router.checkpoint_table()
+        self.now = 150.0
+        router = self.restart()
+        router.apply_entries(next_hop, [(ADDRESS_FAMILY, 50, 1)], self.now)
+        self.assertEqual(router.provisional_routes, {})
+        router.checkpoint_table()
+        self.now = 200.0
+        router = self.restart()
+        self.assertEqual(router.provisional_routes, {50: 150.0})
+
+
+    def test_close_without_a_table(self):
+        router = make_router(0, 2)
+        router.checkpoint_file = self.filename
+        router.close() # as after open() failed with no checkpoint to restore
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertEqual(router.metrics.table_checkpoints, 0)
+
+
+    def test_close_twice(self):
+        router = self.restart()
+        router.table_loaded = True # as after open()
+        router.close()
+        router.close()
+        self.assertTrue(os.path.exists(self.filename))
+        self.assertEqual(router.metrics.table_checkpoints, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
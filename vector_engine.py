@@ -0,0 +1,230 @@
+"""
+Vectorised distance-vector engine for whole RIP version 2 networks.
+    Holds the distance vector of every router in one NumPy matrix and runs
+    synchronous Bellman-Ford rounds, with poisoned reverse and a metric of 16
+    as infinity, as min-plus operations over whole rows. Used to find the
+    converged tables of networks far too large to run as live routers, and to
+    check the tables of real or simulated routers against them.
+    Requires NumPy.
+    Usage: python3 vector_engine.py <config-directory> [--check]
+           python3 vector_engine.py --generate <number-of-routers> [--check]
+"""
+
+import argparse
+import random
+import sys
+from time import perf_counter
+from packets import INF_METRIC
+from config_loader import load_configs
+from simulator import Simulator, configs_from_adjacency
+import config_builder
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NO_ROUTE = -1
+DEFAULT_MAX_ROUNDS = 1000
+
+
+def compare_tables(expected, actual):
+    """ Compare two {router_id: {destination: metric}} tables and return a list
+        of (router_id, destination, expected metric, actual metric) differences"""
+    differences = []
+    for router_id in sorted(set(expected) | set(actual)):
+        expected_routes = expected.get(router_id, {})
+        actual_routes = actual.get(router_id, {})
+        for destination in sorted(set(expected_routes) | set(actual_routes)):
+            expected_metric = expected_routes.get(destination)
+            actual_metric = actual_routes.get(destination)
+            if expected_metric != actual_metric:
+                differences.append((router_id, destination, expected_metric, actual_metric))
+    return differences
+
+
+class VectorNetwork:
+    """
+    Distance vectors of every router in a network.
+     - Create with the configs returned by config_loader.load_configs()
+     - Run with VectorNetwork.step() or VectorNetwork.converge()
+    """
+    def __init__(self, configs):
+        if np is None:
+            raise Exception("The vector engine requires NumPy")
+        self.router_ids = sorted(config[0] for config in configs)
+        self.indexes = {router_id: index for index, router_id in enumerate(self.router_ids)}
+        size = len(self.router_ids)
+
+        self.distances = np.full((size, size), INF_METRIC, dtype=np.uint8)
+        np.fill_diagonal(self.distances, 0)
+        self.next_hops = np.full((size, size), NO_ROUTE, dtype=np.int32)
+        self.rounds = 0
+
+        # A router learns from a neighbour only if both are configured to talk
+        # to each other. The cost is the one in the receiving router's config.
+        outputs = {
+            router_id: {neighbour.router_id: neighbour.metric for neighbour in neighbours}
+            for router_id, _, neighbours, _ in configs
+        }
+        links = {}
+        for router_id, neighbours in outputs.items():
+            for neighbour_id, metric in neighbours.items():
+                if router_id in outputs.get(neighbour_id, {}):
+                    links.setdefault(self.indexes[router_id], []).append(
+                        (self.indexes[neighbour_id], metric)
+                    )
+
+        # Split links into slots holding at most one link per router, so rows
+        # of a slot can be updated together without conflicts
+        self.slots = []
+        for slot in range(max((len(neighbours) for neighbours in links.values()), default=0)):
+            slot_links = [
+                (router, neighbours[slot]) for router, neighbours in links.items()
+                if slot < len(neighbours)
+            ]
+            self.slots.append((
+                np.array([router for router, _ in slot_links], dtype=np.int32),
+                np.array([neighbour for _, (neighbour, _) in slot_links], dtype=np.int32),
+                np.array([metric for _, (_, metric) in slot_links], dtype=np.uint8),
+            ))
+
+
+    def __repr__(self):
+        """ Return a string representation of a VectorNetwork object"""
+        return f"VectorNetwork({len(self.router_ids)} routers, {self.rounds} rounds)"
+
+
+    def candidates(self, routers, neighbours, costs):
+        """ Get the cost to every destination through each (router, neighbour)
+            link, as advertised by the neighbour with poisoned reverse"""
+        advertised = self.distances[neighbours]
+        advertised[self.next_hops[neighbours] == routers[:, None]] = INF_METRIC
+        return np.minimum(advertised + costs[:, None], INF_METRIC).astype(np.uint8)
+
+
+    def step(self):
+        """ Run one synchronous round in which every router receives an update
+            from every neighbour. Returns whether any table changed"""
+        distances = self.distances.copy()
+        next_hops = self.next_hops.copy()
+
+        # A route follows whatever its current next hop advertises
+        for routers, neighbours, costs in self.slots:
+            candidates = self.candidates(routers, neighbours, costs)
+            current = next_hops[routers] == neighbours[:, None]
+            rows = distances[routers]
+            rows[current] = candidates[current]
+            distances[routers] = rows
+
+        # Any neighbour offering a strictly better route replaces it
+        for routers, neighbours, costs in self.slots:
+            candidates = self.candidates(routers, neighbours, costs)
+            better = candidates < distances[routers]
+            distances[routers] = np.where(better, candidates, distances[routers])
+            next_hops[routers] = np.where(better, neighbours[:, None], next_hops[routers])
+
+        next_hops[distances == INF_METRIC] = NO_ROUTE
+        np.fill_diagonal(distances, 0)
+        np.fill_diagonal(next_hops, NO_ROUTE)
+
+        changed = not (
+            np.array_equal(distances, self.distances) and np.array_equal(next_hops, self.next_hops)
+        )
+        self.distances = distances
+        self.next_hops = next_hops
+        self.rounds += 1
+        return changed
+
+
+    def converge(self, max_rounds=DEFAULT_MAX_ROUNDS):
+        """ Run rounds until no table changes. Returns the number of rounds taken
+            to converge, or None if the network did not converge"""
+        start = self.rounds
+        while self.rounds - start < max_rounds:
+            if not self.step():
+                return self.rounds - start - 1
+        return None
+
+
+    def tables(self):
+        """ Get the metric to every reachable destination known by each router,
+            in the same form as Simulator.tables()"""
+        tables = {}
+        for index, router_id in enumerate(self.router_ids):
+            row = self.distances[index]
+            tables[router_id] = {
+                self.router_ids[destination]: int(row[destination])
+                for destination in np.flatnonzero(row < INF_METRIC)
+                if destination != index
+            }
+        return tables
+
+
+    def next_hop_tables(self):
+        """ Get the next hop to every reachable destination of each router"""
+        return {
+            router_id: {
+                self.router_ids[destination]: self.router_ids[self.next_hops[index, destination]]
+                for destination in np.flatnonzero(self.next_hops[index] != NO_ROUTE)
+            }
+            for index, router_id in enumerate(self.router_ids)
+        }
+
+
+def main():
+    """ main"""
+    parser = argparse.ArgumentParser(description="Compute converged RIP tables for a whole network")
+    parser.add_argument("directory", nargs="?", help="directory of router config files, or a snapshot")
+    parser.add_argument("--generate", type=int, metavar="N", help="use a generated network of N routers")
+    parser.add_argument(
+        "--topology", choices=config_builder.TOPOLOGIES, default=config_builder.DEFAULT_TOPOLOGY,
+        help=f"topology of a generated network (default: {config_builder.DEFAULT_TOPOLOGY})"
+    )
+    parser.add_argument(
+        "--degree", type=float, default=config_builder.DEFAULT_DEGREE,
+        help=f"average links per router in a generated network (default: {config_builder.DEFAULT_DEGREE})"
+    )
+    parser.add_argument("--seed", type=int, help="seed for generated networks and the simulator")
+    parser.add_argument("--max-rounds", type=int, default=DEFAULT_MAX_ROUNDS)
+    parser.add_argument(
+        "--check", action="store_true",
+        help="simulate the network with real Router objects and compare their tables"
+    )
+    parser.add_argument("--until", type=float, default=600, help="virtual seconds to simulate with --check")
+    args = parser.parse_args()
+    if (args.directory is None) == (args.generate is None):
+        parser.error("give either a config directory or --generate")
+
+    try:
+        if args.generate is not None:
+            random.seed(args.seed)
+            ids = config_builder.random_router_ids(args.generate)
+            configs = configs_from_adjacency(config_builder.generate_adjacency_list(ids, args.topology, args.degree))
+        else:
+            configs = load_configs(args.directory)
+        network = VectorNetwork(configs)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit()
+
+    start = perf_counter()
+    rounds = network.converge(args.max_rounds)
+    elapsed = perf_counter() - start
+    if rounds is None:
+        print(f"Network of {len(network.router_ids)} routers did not converge in {args.max_rounds} rounds")
+    else:
+        print(f"Network of {len(network.router_ids)} routers converged in {rounds} rounds")
+    print(f"    {elapsed:.3f} seconds of real time")
+
+    if args.check:
+        simulator = Simulator(configs, seed=args.seed)
+        simulator.run_until_converged(args.until)
+        differences = compare_tables(network.tables(), simulator.tables())
+        print(f"Simulated routers after {simulator.now:.1f} virtual seconds: {len(differences)} differences")
+        for router_id, destination, expected, actual in differences[:20]:
+            print(f"    Router {router_id} to {destination}: expected {expected}, found {actual}")
+
+
+if __name__ == "__main__":
+    main()